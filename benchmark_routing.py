@@ -0,0 +1,62 @@
+"""
+Micro-benchmark of the message routing: the old is_command_trade substring scan vs the compiled Router.
+Run: python benchmark_routing.py
+"""
+import random
+import timeit
+from crypto_trading_news.routing import Router, RoutingRule, DEFAULT_TRADE_KEYWORDS
+
+TRADE_PEER_ID = 222222222
+NEWS_PEER_ID = 111111111
+
+def is_command_trade(text: str | None) -> bool:
+    """Routing before Router: six substring scans of the lowercased text"""
+    return text is not None and any(pattern in text.lower() for pattern in ["short", "long", "buy", "sell", "leverage", "sl"])
+
+SAMPLES = [
+    "#BTC LONG\nEntry: 60000 - 60500\nTP1: 61000\nTP2: 62000\nSL: 59000\nLeverage: 20x",
+    "$SOL short 10x, entry zone 150-152, targets 148 / 145 / 140, stop loss 155",
+    "Binance will list Jito (JTO) with seed tag applied, deposits open now",
+    "SEC delays decision on spot ETH ETF applications, markets slowly recover after the announcement",
+    "The Fed is expected to keep rates unchanged for longer as inflation stays sticky",
+    "Whale alert: 1,500 BTC transferred from unknown wallet to Coinbase",
+    "Bitcoin slips below $60k as long-term holders take profit and miners sell inventory",
+]
+
+def corpus(size: int) -> list[str]:
+    rng = random.Random(0)
+    return [rng.choice(SAMPLES) + " " + " ".join(rng.choice(SAMPLES).split()[:rng.randint(0, 20)]) for _ in range(size)]
+
+def main():
+    texts = corpus(10_000)
+    router = Router([RoutingRule([TRADE_PEER_ID], ["telegram", "discord", "threads"], DEFAULT_TRADE_KEYWORDS)], [NEWS_PEER_ID])
+    wide_router = Router([
+        RoutingRule([TRADE_PEER_ID], ["telegram", "discord", "threads"], DEFAULT_TRADE_KEYWORDS + ["stop loss", "take profit", "entry", "tp1", "tp2"]),
+        RoutingRule([NEWS_PEER_ID, 333333333], ["telegram:binance_announcements"], ["list", "listing", "delist"]),
+        RoutingRule([444444444], ["*"], ["etf", "sec", "fed", "cpi"]),
+    ], [NEWS_PEER_ID])
+
+    def run_legacy():
+        for text in texts:
+            TRADE_PEER_ID if is_command_trade(text) else NEWS_PEER_ID
+    def run_router():
+        for text in texts:
+            router.route(text, "telegram:123", "telegram:channel")
+    def run_wide_router():
+        for text in texts:
+            wide_router.route(text, "telegram:123", "telegram:binance_announcements")
+
+    wide_keywords = len({keyword for rule in wide_router.rules for keyword in rule.keywords})
+    for name, run in [("is_command_trade", run_legacy), ("Router (default rule)", run_router), (f"Router (3 rules, {wide_keywords} keywords)", run_wide_router)]:
+        seconds = min(timeit.repeat(run, number=1, repeat=5))
+        print(f"{name: <32} {seconds / len(texts) * 1e6:7.2f} us/message")
+
+    trade_legacy = sum(is_command_trade(text) for text in texts)
+    trade_router = sum(TRADE_PEER_ID in router.route(text, "telegram:123") for text in texts)
+    print(f"\nrouted to the trade chat: is_command_trade {trade_legacy}, Router {trade_router} (whole words only)")
+    for text in SAMPLES:
+        if is_command_trade(text) != (TRADE_PEER_ID in router.route(text, "telegram:123")):
+            print(f"- differs: {text[:70]!r}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+from .logger import Logger
+from .config import Config
+from .notification import Message
+from .binance_api import AsyncBinanceAPI
+from binance import BinanceSocketManager
+from typing import AsyncIterator, Callable
+import asyncio
+import json
+import time
+
+LISTEN_KEY_KEEPALIVE = 30 * 60 # listenKey expires after 60 minutes without keepalive
+STABLE_ASSETS = {"USDT", "USDC", "FDUSD", "BNFCR"} # margin assets counted 1:1 in the wallet balance
+OPEN_ORDER_STATUSES = {"NEW", "PARTIALLY_FILLED"}
+
+class BinanceUserDataSource:
+    """Futures user-data events (listenKey) and all mark prices on one combined stream"""
+    def __init__(self, binance_api: AsyncBinanceAPI):
+        self.binance_api = binance_api
+
+    async def keepalive(self, listen_key: str):
+        while True:
+            await asyncio.sleep(LISTEN_KEY_KEEPALIVE)
+            await self.binance_api.f_keepalive_listen_key(listen_key)
+
+    async def stream(self, on_open: Callable[[], None] | None = None) -> AsyncIterator[dict]:
+        """on_open runs once subscribed, no event after that point is missed"""
+        listen_key = await self.binance_api.f_listen_key()
+        keepalive_task = asyncio.create_task(self.keepalive(listen_key))
+        try:
+            bm = BinanceSocketManager(self.binance_api.binance_client)
+            async with bm.futures_multiplex_socket([listen_key, "!markPrice@arr@1s"]) as socket:
+                if on_open is not None:
+                    on_open()
+                while True:
+                    msg = await socket.recv()
+                    data = msg.get("data", msg) if msg else None
+                    if not data:
+                        continue
+                    if isinstance(data, dict) and data.get("e") == "error":
+                        raise Exception(data.get("m"))
+                    if isinstance(data, dict) and data.get("e") == "listenKeyExpired":
+                        raise Exception("listenKey expired")
+                    yield data
+        finally:
+            keepalive_task.cancel()
+
+class ReplayUserDataSource:
+    """
+    Local stand-in for the user-data stream, replays recorded events so the mirror can be exercised offline.
+    events: list of payloads or path to a JSON lines file, as sent by Binance (ACCOUNT_UPDATE, ORDER_TRADE_UPDATE,
+    ACCOUNT_CONFIG_UPDATE or a list of markPriceUpdate)
+    """
+    def __init__(self, events: list | str, delay: float = 0.0):
+        if isinstance(events, str):
+            with open(events, "r") as file:
+                events = [json.loads(line) for line in file if line.strip()]
+        self.events = [event.get("data", event) if isinstance(event, dict) else event for event in events]
+        self.delay = delay
+
+    async def stream(self, on_open: Callable[[], None] | None = None) -> AsyncIterator[dict]:
+        if on_open is not None:
+            on_open()
+        for event in self.events:
+            yield event
+            await asyncio.sleep(self.delay)
+        # a live stream never ends, keep the mirror up once the recording is exhausted
+        await asyncio.Event().wait()
+
+class FuturesAccountMirror:
+    """
+    In-memory futures balances, positions and open orders, kept up to date from the user-data stream
+    and reconciled over REST every ACCOUNT_MIRROR_RECONCILE_INTERVAL.
+    A REST snapshot is only taken once the stream is subscribed: events are buffered from the subscription on
+    and replayed over the snapshot, so nothing falls between the two.
+    account() and positions() return the same shapes as futures_account() and futures_position_information().
+    """
+    def __init__(self, config: Config, logger: Logger, binance_api: AsyncBinanceAPI, source: BinanceUserDataSource | ReplayUserDataSource | None = None):
+        self.config = config
+        self.logger = logger
+        self.binance_api = binance_api
+        self.source = source or BinanceUserDataSource(binance_api)
+        self.balances: dict[str, float] = {} # asset -> wallet balance
+        self.map_position: dict[str, dict] = {} # symbol -> position, REST field names
+        self.map_open_order: dict[int, dict] = {} # orderId -> order, REST field names
+        self.map_leverage: dict[str, int] = {}
+        self.map_margin_type: dict[str, str] = {} # symbol -> CROSSED/ISOLATED, as set by change_margin_type
+        self.map_mark_price: dict[str, float] = {}
+        self.synced = False
+        self.stream_open = False
+        self.updated_at = 0.0
+        self.events = 0
+        self.reconciles = 0
+        self._replay: list[dict] | None = None # events received while a REST snapshot is in flight
+        self._snapshot_task: asyncio.Task | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def ready(self) -> bool:
+        """Synced once over REST and the stream is alive, the mark prices alone arrive every second"""
+        return self.synced and time.time() - self.updated_at < self.config.ACCOUNT_MIRROR_STALE_AFTER
+
+    def start(self):
+        if self.config.ACCOUNT_MIRROR_ENABLED and len(self._tasks) == 0:
+            self._tasks = [asyncio.create_task(self.run()), asyncio.create_task(self.run_reconcile())]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self.cancel_snapshot()
+
+    def on_stream_open(self):
+        # subscribed: buffer from here and take the snapshot, the buffer brings it up to date
+        self.stream_open = True
+        self.start_snapshot()
+
+    async def run(self):
+        while True:
+            try:
+                async for event in self.source.stream(self.on_stream_open):
+                    self.apply(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                self.logger.error(Message(
+                    title="Error FuturesAccountMirror.run",
+                    body=f"Error: {err=}\nReconnect after 5s",
+                    chat_id=self.config.TELEGRAM_LOG_PEER_ID
+                ), notification=True)
+            # events are lost until the next subscription, which takes a new snapshot
+            self.stream_open = False
+            self.synced = False
+            self.cancel_snapshot()
+            await asyncio.sleep(5)
+
+    async def run_reconcile(self):
+        while True:
+            await asyncio.sleep(self.config.ACCOUNT_MIRROR_RECONCILE_INTERVAL)
+            await self.reconcile()
+
+    async def reconcile(self):
+        """Periodic resync, only while subscribed (the snapshot of a new subscription is taken by on_stream_open)"""
+        if not self.stream_open or self._snapshot_task is not None:
+            return
+        self.start_snapshot()
+        await asyncio.wait([self._snapshot_task]) # doesn't raise if a new subscription cancels it
+
+    def start_snapshot(self):
+        self.cancel_snapshot()
+        self._replay = []
+        self._snapshot_task = asyncio.create_task(self.load_snapshot())
+
+    def cancel_snapshot(self):
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+        self._replay = None
+
+    async def load_snapshot(self):
+        try:
+            account_info, positions, open_orders = await asyncio.gather(
+                self.binance_api.get_futures_account(),
+                self.binance_api.get_current_position(),
+                self.binance_api.f_open_orders()
+            )
+        except Exception as err:
+            self.logger.error(Message(
+                title="Error FuturesAccountMirror.reconcile",
+                body=f"Error: {err=}",
+                chat_id=self.config.TELEGRAM_LOG_PEER_ID
+            ), notification=True)
+            self._replay = None
+            self._snapshot_task = None
+            return
+        # events carry absolute values, replaying the ones received meanwhile brings the snapshot up to date
+        replay, self._replay = self._replay, None
+        self._snapshot_task = None
+        self.load(account_info, positions, open_orders)
+        for event in replay:
+            self.apply(event)
+
+    def load(self, account_info: dict, positions: list, open_orders: list):
+        self.balances = {asset["asset"]: float(asset["walletBalance"]) for asset in account_info.get("assets", [])}
+        for position in account_info.get("positions", []):
+            if "leverage" in position:
+                self.map_leverage[position["symbol"]] = int(position["leverage"])
+            if "isolated" in position:
+                self.map_margin_type[position["symbol"]] = "ISOLATED" if position["isolated"] else "CROSSED"
+        self.map_position = {}
+        for position in positions:
+            if abs(float(position["positionAmt"])) > 0:
+                self.map_position[position["symbol"]] = dict(position)
+                # the streamed mark price is fresher than the REST one
+                self.map_mark_price.setdefault(position["symbol"], float(position["markPrice"]))
+        self.map_open_order = {int(order["orderId"]): dict(order) for order in open_orders}
+        self.synced = True
+        self.updated_at = time.time()
+        self.reconciles += 1
+
+    def apply(self, event: dict | list):
+        self.updated_at = time.time()
+        if isinstance(event, list): # !markPrice@arr
+            for mark in event:
+                self.map_mark_price[mark["s"]] = float(mark["p"])
+            return
+        self.events += 1
+        if self._replay is not None:
+            self._replay.append(event)
+        if event.get("e") == "ACCOUNT_UPDATE":
+            self.apply_account_update(event["a"])
+        elif event.get("e") == "ORDER_TRADE_UPDATE":
+            self.apply_order_update(event["o"])
+        elif event.get("e") == "ACCOUNT_CONFIG_UPDATE" and "ac" in event:
+            self.map_leverage[event["ac"]["s"]] = int(event["ac"]["l"])
+
+    def apply_account_update(self, update: dict):
+        for balance in update.get("B", []):
+            self.balances[balance["a"]] = float(balance["wb"])
+        for position in update.get("P", []):
+            symbol = position["s"]
+            # also sent without a position when the margin type is changed (reason MARGIN_TYPE_CHANGE)
+            if "mt" in position:
+                self.map_margin_type[symbol] = "ISOLATED" if position["mt"] == "isolated" else "CROSSED"
+            amount = float(position["pa"])
+            if amount == 0:
+                self.map_position.pop(symbol, None)
+                continue
+            self.map_position[symbol] = {
+                **self.map_position.get(symbol, {}),
+                "symbol": symbol,
+                "positionAmt": position["pa"],
+                "entryPrice": position["ep"],
+                "unRealizedProfit": position["up"],
+                "marginType": position.get("mt", "cross"),
+                "positionSide": position.get("ps", "BOTH"),
+            }
+
+    def apply_order_update(self, order: dict):
+        order_id = int(order["i"])
+        if order["X"] not in OPEN_ORDER_STATUSES:
+            self.map_open_order.pop(order_id, None)
+            return
+        self.map_open_order[order_id] = {
+            "orderId": order_id,
+            "symbol": order["s"],
+            "clientOrderId": order["c"],
+            "side": order["S"],
+            "type": order["o"],
+            "origQty": order["q"],
+            "executedQty": order["z"],
+            "price": order["p"],
+            "stopPrice": order["sp"],
+            "reduceOnly": order.get("R", False),
+            "status": order["X"],
+        }
+
+    def open_order_margin(self, symbol: str) -> float:
+        """Initial margin held by the open orders of a symbol, the way Binance estimates it (price * remaining qty / leverage)"""
+        leverage = self.map_leverage.get(symbol, 1)
+        margin = 0.0
+        for order in self.map_open_order.values():
+            if order["symbol"] != symbol or order.get("reduceOnly"):
+                continue
+            price = float(order["price"]) or float(order["stopPrice"]) or self.map_mark_price.get(symbol, 0.0)
+            margin += (float(order["origQty"]) - float(order["executedQty"])) * price / leverage
+        return margin
+
+    def positions(self, symbol: str | None = None) -> list[dict]:
+        """Open positions and symbols with open orders, valued at the latest mark price"""
+        symbols = set(self.map_position) | {order["symbol"] for order in self.map_open_order.values()}
+        if symbol is not None:
+            symbols &= {symbol}
+        result = []
+        for s in sorted(symbols):
+            position = self.map_position.get(s, {"symbol": s, "positionAmt": "0", "entryPrice": "0", "unRealizedProfit": "0"})
+            amount = float(position["positionAmt"])
+            mark_price = self.map_mark_price.get(s, float(position.get("markPrice", 0) or 0))
+            notional = amount * mark_price
+            leverage = self.map_leverage.get(s, 1)
+            result.append({
+                **position,
+                "markPrice": str(mark_price),
+                "notional": str(notional),
+                "unRealizedProfit": str(amount * (mark_price - float(position["entryPrice"]))) if mark_price else position["unRealizedProfit"],
+                "positionInitialMargin": str(abs(notional) / leverage),
+                "openOrderInitialMargin": str(self.open_order_margin(s)),
+                "leverage": str(leverage),
+            })
+        return result
+
+    def account(self) -> dict:
+        positions = self.positions()
+        wallet_balance = sum(balance for asset, balance in self.balances.items() if asset in STABLE_ASSETS)
+        unrealized_profit = sum(float(position["unRealizedProfit"]) for position in positions)
+        position_margin = sum(float(position["positionInitialMargin"]) for position in positions)
+        open_order_margin = sum(float(position["openOrderInitialMargin"]) for position in positions)
+        margin_balance = wallet_balance + unrealized_profit
+        return {
+            "totalWalletBalance": str(wallet_balance),
+            "totalUnrealizedProfit": str(unrealized_profit),
+            "totalMarginBalance": str(margin_balance),
+            "totalPositionInitialMargin": str(position_margin),
+            "totalOpenOrderInitialMargin": str(open_order_margin),
+            "totalInitialMargin": str(position_margin + open_order_margin),
+            "availableBalance": str(max(0.0, margin_balance - position_margin - open_order_margin)),
+        }
+
+    async def snapshot(self, symbol: str | None = None) -> tuple[dict, list]:
+        """(account, positions) from the mirror, over REST while it is not ready"""
+        if self.ready:
+            return self.account(), self.positions(symbol)
+        return await asyncio.gather(self.binance_api.get_futures_account(), self.binance_api.get_current_position(symbol))
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "events": self.events,
+            "reconciles": self.reconciles,
+            "positions": len(self.map_position),
+            "open_orders": len(self.map_open_order),
+        }
@@ -0,0 +1,85 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Iterator
+
+class PriceAlert:
+    def __init__(self, op: str, price: float, gap: float = 0.5):
+        self.op = op
+        self.price = price
+        self.gap = gap
+    def __str__(self):
+        return self.op + " " + str(self.price) + f" ({self.gap}%)"
+    def equal(self, price: float):
+        if (abs(self.price - price) / self.price) <= self.gap / 100.0: # check around gap%
+            return True
+        if self.op == '<':
+            return price <= self.price
+        else:
+            return price >= self.price
+    @property
+    def threshold(self) -> float:
+        """Edge of the gap band, '<' fires at or below it and '>' at or above it"""
+        if self.op == '<':
+            return self.price * (1 + self.gap / 100.0)
+        return self.price * (1 - self.gap / 100.0)
+
+class AlertIndex:
+    """
+    All PriceAlert of one symbol.
+    Thresholds of '<' and '>' alerts are kept in two sorted arrays so triggered alerts are a bisect away,
+    while the insertion order is kept for the indices shown by /falert_list and used by /falert_remove.
+    """
+    def __init__(self):
+        self._seq = 0
+        self._alerts: dict[int, PriceAlert] = {} # seq -> alert, insertion ordered
+        self._below: list[tuple[float, int]] = [] # (threshold, seq) of '<' alerts, ascending
+        self._above: list[tuple[float, int]] = [] # (threshold, seq) of '>' alerts, ascending
+
+    def __len__(self):
+        return len(self._alerts)
+
+    def __iter__(self) -> Iterator[PriceAlert]:
+        return iter(list(self._alerts.values()))
+
+    def __getitem__(self, idx: int) -> PriceAlert:
+        return list(self._alerts.values())[idx]
+
+    def _keys(self, alert: PriceAlert) -> list[tuple[float, int]]:
+        return self._below if alert.op == '<' else self._above
+
+    def append(self, alert: PriceAlert):
+        seq = self._seq
+        self._seq += 1
+        self._alerts[seq] = alert
+        insort(self._keys(alert), (alert.threshold, seq))
+
+    def pop(self, idx: int) -> PriceAlert:
+        seq = list(self._alerts)[idx]
+        alert = self._alerts.pop(seq)
+        keys = self._keys(alert)
+        del keys[bisect_left(keys, (alert.threshold, seq))]
+        return alert
+
+    def clear(self):
+        self._alerts.clear()
+        self._below.clear()
+        self._above.clear()
+
+    def pop_triggered(self, price: float) -> list[PriceAlert]:
+        """Remove and return, in insertion order, every alert whose equal(price) is True"""
+        # '<' alerts fire when threshold >= price: a suffix of _below
+        i = bisect_left(self._below, (price, -1))
+        # threshold is a float product, settle the boundary with equal() itself
+        while i > 0 and self._alerts[self._below[i - 1][1]].equal(price):
+            i -= 1
+        while i < len(self._below) and not self._alerts[self._below[i][1]].equal(price):
+            i += 1
+        # '>' alerts fire when threshold <= price: a prefix of _above
+        j = bisect_right(self._above, (price, self._seq))
+        while j < len(self._above) and self._alerts[self._above[j][1]].equal(price):
+            j += 1
+        while j > 0 and not self._alerts[self._above[j - 1][1]].equal(price):
+            j -= 1
+        list_seq = [seq for _, seq in self._below[i:]] + [seq for _, seq in self._above[:j]]
+        del self._below[i:]
+        del self._above[:j]
+        return [self._alerts.pop(seq) for seq in sorted(list_seq)]
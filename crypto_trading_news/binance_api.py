@@ -1,72 +1,219 @@
 from .config import Config
 from .config import ProxyConfig
 from .logger import Logger
+from .notification import Message
 from .util import convert_to_seconds
 import threading
-from contextlib import contextmanager
-from typing import Dict
-from binance.client import Client
+from typing import Awaitable, Callable, Dict
+from binance import AsyncClient
+import aiohttp
+import asyncio
 import time
 
 BINANCE_INTERVAL = ["1s", "1m", "3m", "5m", "15m", "30m", "1h", "2h", "4h", "6h", "8h", "12h", "1d", "3d", "1w", "1M"]
 
-class BinanceCache:  # pylint: disable=too-few-public-methods
-    _balances: Dict[str, float] = {}
-    _balances_mutex: threading.Lock = threading.Lock()
+def resolve_kline_params(interval: str | None = None, range: str | None = None) -> tuple[str, int]:
+    """Interval (default 15m) and range in seconds (default 21 candles) of a klines request"""
+    if interval is None or interval not in BINANCE_INTERVAL:
+        interval = "15m"
+    if range is None:
+        return interval, convert_to_seconds(interval) * 21
+    return interval, convert_to_seconds(range)
 
-    @contextmanager
-    def open_balances(self):
-        with self._balances_mutex:
-            yield self._balances
-class BinanceAPI:
+class SymbolInfoCache:
+    """Futures exchange info indexed by symbol, swapped atomically on every refresh"""
+    def __init__(self, ttl: int = 3600):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._symbols: Dict[str, dict] = {}
+        self._loaded_at = 0.0
+        self._refresh_claimed_at = 0.0
+        self._mutex = threading.Lock()
+
+    def load(self, exchange_info: dict):
+        symbols = {}
+        for info in exchange_info.get("symbols", []):
+            filters = {f["filterType"]: f for f in info.get("filters", [])}
+            info["filtersByType"] = filters
+            info["tickSize"] = float(filters.get("PRICE_FILTER", {}).get("tickSize", 0))
+            info["stepSize"] = float(filters.get("LOT_SIZE", {}).get("stepSize", 0))
+            info["minQty"] = float(filters.get("LOT_SIZE", {}).get("minQty", 0))
+            info["minNotional"] = float(filters.get("MIN_NOTIONAL", {}).get("notional", 0))
+            symbols[info["symbol"]] = info
+        with self._mutex:
+            self._symbols = symbols
+            self._loaded_at = time.time()
+
+    def get(self, symbol: str) -> dict | None:
+        info = self._symbols.get(symbol)
+        if info is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return info
+
+    def claim_refresh(self, min_interval: float = 60) -> bool:
+        """True at most once per min_interval since the last load, a miss may be a symbol listed meanwhile"""
+        with self._mutex:
+            now = time.time()
+            if now - max(self._loaded_at, self._refresh_claimed_at) < min_interval:
+                return False
+            self._refresh_claimed_at = now
+            return True
+
+    @property
+    def is_stale(self) -> bool:
+        return time.time() - self._loaded_at >= self.ttl
+
+    def stats(self) -> dict:
+        with self._mutex:
+            return {
+                "symbols": len(self._symbols),
+                "hits": self.hits,
+                "misses": self.misses,
+                "age": round(time.time() - self._loaded_at) if self._loaded_at else None,
+            }
+
+class SnapshotCache:
+    """Short-TTL copy of an all-symbols endpoint indexed by symbol, concurrent readers share one in-flight fetch"""
+    def __init__(self, loader: Callable[[], Awaitable[list[dict]]], ttl: float):
+        self.loader = loader
+        self.ttl = ttl
+        self.hits = 0
+        self.fetches = 0
+        self.coalesced = 0
+        self._rows: Dict[str, dict] = {}
+        self._fetched_at = 0.0
+        self._inflight: asyncio.Future | None = None
+
+    async def get_all(self) -> Dict[str, dict]:
+        if time.monotonic() - self._fetched_at < self.ttl:
+            self.hits += 1
+            return self._rows
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._fetch())
+        else:
+            self.coalesced += 1
+        # shield: a cancelled reader must not cancel the fetch other readers wait on
+        return await asyncio.shield(self._inflight)
+
+    async def get(self, symbol: str) -> dict | None:
+        return (await self.get_all()).get(symbol)
+
+    async def _fetch(self) -> Dict[str, dict]:
+        try:
+            rows = await self.loader()
+            self._rows = {row["symbol"]: row for row in rows}
+            self._fetched_at = time.monotonic()
+            self.fetches += 1
+            return self._rows
+        finally:
+            self._inflight = None
+
+    def stats(self) -> dict:
+        return {"symbols": len(self._rows), "hits": self.hits, "fetches": self.fetches, "coalesced": self.coalesced}
+
+class AsyncBinanceAPI:
+    """Binance spot/futures REST client on asyncio, all requests share one pooled keep-alive session"""
     def __init__(self, config: Config, logger: Logger):
         self.config = config
         self.logger = logger
-        self.binance_client = Client(
-            api_key=config.BINANCE_API_KEY,
-            api_secret=config.BINANCE_API_SECRET,
-            tld=config.BINANCE_TLD,
-            requests_params={"proxies" : ProxyConfig(config.BINANCE_PROXY_URL).binance_proxies} if config.BINANCE_PROXY_URL else None
+        self.binance_client: AsyncClient | None = None
+        self.symbol_info = SymbolInfoCache(config.BINANCE_SYMBOL_INFO_TTL)
+        self._symbol_info_task: asyncio.Task | None = None
+        self._symbol_info_reload: asyncio.Task | None = None
+        # one request for all symbols instead of one per coin
+        self.f_ticker_snapshot = SnapshotCache(lambda: self.binance_client.futures_ticker(), config.BINANCE_TICKER_TTL)
+        self.f_price_snapshot = SnapshotCache(lambda: self.binance_client.futures_symbol_ticker(), config.BINANCE_TICKER_TTL)
+        self.spot_price_snapshot = SnapshotCache(lambda: self.binance_client.get_symbol_ticker(), config.BINANCE_TICKER_TTL)
+
+    async def connect(self):
+        proxies = ProxyConfig(self.config.BINANCE_PROXY_URL).binance_proxies if self.config.BINANCE_PROXY_URL else None
+        connector = aiohttp.TCPConnector(limit=self.config.BINANCE_POOL_SIZE, keepalive_timeout=60, ttl_dns_cache=300)
+        self.binance_client = await AsyncClient.create(
+            api_key=self.config.BINANCE_API_KEY,
+            api_secret=self.config.BINANCE_API_SECRET,
+            tld=self.config.BINANCE_TLD,
+            https_proxy=proxies["https"] if proxies else None,
+            session_params={"connector": connector}
         )
+        # first load is awaited so lookups never have to wait afterwards
+        try:
+            self.symbol_info.load(await self.f_exchange_info())
+        except Exception as err:
+            self.logger.error(Message(
+                title="Error AsyncBinanceAPI.connect - exchange info",
+                body=f"Error: {err=}",
+                chat_id=self.config.TELEGRAM_LOG_PEER_ID
+            ), notification=True)
+        self._symbol_info_task = asyncio.create_task(self.refresh_symbol_info_loop())
+
+    async def close(self):
+        if self._symbol_info_task:
+            self._symbol_info_task.cancel()
+        if self._symbol_info_reload:
+            self._symbol_info_reload.cancel()
+        if self.binance_client:
+            await self.binance_client.close_connection()
+
+    async def refresh_symbol_info_loop(self):
+        while True:
+            await asyncio.sleep(self.symbol_info.ttl if not self.symbol_info.is_stale else 30)
+            await self.refresh_symbol_info()
+
+    async def refresh_symbol_info(self):
+        try:
+            self.symbol_info.load(await self.f_exchange_info())
+        except Exception as err:
+            self.logger.error(Message(
+                title="Error AsyncBinanceAPI.refresh_symbol_info",
+                body=f"Error: {err=}",
+                chat_id=self.config.TELEGRAM_LOG_PEER_ID
+            ), notification=True)
 
     # spot api
-    def get_account(self):
+    async def get_account(self):
         """
         Get account information
         """
-        return self.binance_client.get_account(omitZeroBalances="true")
-    
-    def get_ticker_price(self, symbol: str):
-        price = self.binance_client.get_symbol_ticker(symbol=symbol)
+        return await self.binance_client.get_account(omitZeroBalances="true")
+
+    async def get_ticker_price(self, symbol: str):
+        price = await self.spot_price_snapshot.get(symbol)
         if price is None or "price" not in price:
             return 0.0
         return float(price["price"])
 
+    async def get_spot_prices(self) -> Dict[str, float]:
+        """symbol -> last price of every spot symbol, from the shared snapshot"""
+        return {symbol: float(price["price"]) for symbol, price in (await self.spot_price_snapshot.get_all()).items()}
+
     # future api
-    def get_futures_account(self):
-        return self.binance_client.futures_account()
-    
-    def get_position_info(self, symbol: str | None = None): # include leverage, marginType
+    async def get_futures_account(self):
+        return await self.binance_client.futures_account()
+
+    async def get_position_info(self, symbol: str | None = None): # include leverage, marginType
         if symbol is None:
-            return self.binance_client.futures_position_information(version=2)
-        return self.binance_client.futures_position_information(symbol=symbol, version=2)
+            return await self.binance_client.futures_position_information(version=2)
+        return await self.binance_client.futures_position_information(symbol=symbol, version=2)
 
-    def get_current_position(self, symbol: str | None = None):
+    async def get_current_position(self, symbol: str | None = None):
         if symbol is None:
-            return self.binance_client.futures_position_information()
-        return self.binance_client.futures_position_information(symbol=symbol)
-    
+            return await self.binance_client.futures_position_information()
+        return await self.binance_client.futures_position_information(symbol=symbol)
+
     def f_get_symbol_info(self, symbol: str):
-        info = self.f_exchange_info()
-        for x in info['symbols']:
-            if x['symbol'] == symbol:
-                return x
-        return None
-            
-    def f_exchange_info(self):
-        return self.binance_client.futures_exchange_info()
-
-    def f_order(self, order: dict):
+        info = self.symbol_info.get(symbol)
+        # a miss may be a symbol listed since the last load: reload in the background, this lookup gets None
+        if info is None and self.binance_client is not None and self.symbol_info.claim_refresh():
+            self._symbol_info_reload = asyncio.create_task(self.refresh_symbol_info())
+        return info
+
+    async def f_exchange_info(self):
+        return await self.binance_client.futures_exchange_info()
+
+    async def f_order(self, order: dict):
         # Define the set of fields futures_create_order accepts
         allowed_keys = {
             "symbol", "side", "type", "timeInForce", "quantity", "reduceOnly",
@@ -77,34 +224,48 @@ class BinanceAPI:
 
         # Filter only valid keys
         clean_order = {k: v for k, v in order.items() if k in allowed_keys}
-        return self.binance_client.futures_create_order(**clean_order)
-
-    def f_batch_order(self, batch_orders: list[dict]):
-        return self.binance_client.futures_place_batch_order(batchOrders=batch_orders)
-    
-    def f_change_margin_type(self, symbol: str, marginType: str = "CROSSED"):
-        self.binance_client.futures_change_margin_type(symbol=symbol, marginType=marginType)
-
-    def f_change_leverage(self, symbol: str, leverage: int):
-        return self.binance_client.futures_change_leverage(symbol=symbol, leverage=leverage)
-
-    def f_price(self, symbol: str) -> float:
-        return float(self.binance_client.futures_symbol_ticker(symbol=symbol)["price"])
-    
-    def f_cancel_all_open_orders(self, symbol: str):
-        return self.binance_client.futures_cancel_all_open_orders(symbol=symbol)
-    
-    def f_get_historical_klines(self, symbol: str, interval: str | None = None, range: str | None = None):
-        if interval is None or interval not in BINANCE_INTERVAL:
-            interval = "15m"
-        if range is None:
-            range = convert_to_seconds(interval) * 21
-        else:
-            range = convert_to_seconds(range)
-        return self.binance_client.futures_historical_klines(symbol, interval, round(time.time() - range) * 1000), interval
-
-    def f_24hr_ticker(self, symbol: str):
-        return self.binance_client.futures_ticker(symbol=symbol)
-    
-    def f_user_trades(self, symbol: str, orderId: int):
-        return self.binance_client.futures_account_trades(symbol=symbol, orderId=orderId)
\ No newline at end of file
+        return await self.binance_client.futures_create_order(**clean_order)
+
+    async def f_batch_order(self, batch_orders: list[dict]):
+        return await self.binance_client.futures_place_batch_order(batchOrders=batch_orders)
+
+    async def f_change_margin_type(self, symbol: str, marginType: str = "CROSSED"):
+        await self.binance_client.futures_change_margin_type(symbol=symbol, marginType=marginType)
+
+    async def f_change_leverage(self, symbol: str, leverage: int):
+        return await self.binance_client.futures_change_leverage(symbol=symbol, leverage=leverage)
+
+    async def f_price(self, symbol: str) -> float:
+        price = await self.f_price_snapshot.get(symbol)
+        if price is None: # unknown to the snapshot, let the exchange raise the proper error
+            price = await self.binance_client.futures_symbol_ticker(symbol=symbol)
+        return float(price["price"])
+
+    async def f_cancel_all_open_orders(self, symbol: str):
+        return await self.binance_client.futures_cancel_all_open_orders(symbol=symbol)
+
+    async def f_open_orders(self):
+        return await self.binance_client.futures_get_open_orders()
+
+    async def f_listen_key(self) -> str:
+        return await self.binance_client.futures_stream_get_listen_key()
+
+    async def f_keepalive_listen_key(self, listen_key: str):
+        return await self.binance_client.futures_stream_keepalive(listenKey=listen_key)
+
+    async def f_get_historical_klines(self, symbol: str, interval: str | None = None, range: str | None = None):
+        interval, range = resolve_kline_params(interval, range)
+        return await self.binance_client.futures_historical_klines(symbol, interval, round(time.time() - range) * 1000), interval
+
+    async def f_klines(self, symbol: str, interval: str, start_time: int, limit: int = 1500):
+        """One page of klines opened at or after start_time (ms)"""
+        return await self.binance_client.futures_klines(symbol=symbol, interval=interval, startTime=start_time, limit=limit)
+
+    async def f_24hr_ticker(self, symbol: str):
+        ticker_24h = await self.f_ticker_snapshot.get(symbol)
+        if ticker_24h is None: # unknown to the snapshot, let the exchange raise the proper error
+            ticker_24h = await self.binance_client.futures_ticker(symbol=symbol)
+        return ticker_24h
+
+    async def f_user_trades(self, symbol: str, orderId: int):
+        return await self.binance_client.futures_account_trades(symbol=symbol, orderId=orderId)
@@ -0,0 +1,137 @@
+from .logger import Logger
+from .config import Config
+from .util import convert_to_seconds
+from .indicators import compute, OVERLAY_INDICATORS
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from typing import Awaitable, Callable
+import numpy as np
+import multiprocessing
+import asyncio
+import time
+import io
+
+CHART_DPI = 300
+
+# set once per worker process by init_worker
+_style = None
+
+def init_worker():
+    """Runs in every worker process: headless backend and the mplfinance style, built once instead of per chart"""
+    global _style
+    import matplotlib
+    matplotlib.use("Agg")
+    import mplfinance as mpf
+    # Create my own `marketcolors` style:
+    mc = mpf.make_marketcolors(up='#2fc71e',down='#ed2f1a',inherit=True)
+    # Create my own `MatPlotFinance` style:
+    _style = mpf.make_mpf_style(base_mpl_style=['bmh', 'dark_background'], marketcolors=mc, y_on_right=True)
+
+def render(type: str, symbol: str, klines: np.ndarray, interval: str, timezone: str, indicators: tuple = (), start_time: int = 0) -> bytes:
+    """
+    Runs in a worker process, klines is a KLINE_DTYPE array, returns the PNG bytes.
+    Indicators are computed over all klines, only the candles opened from start_time (ms) are drawn,
+    so the older klines only warm the indicators up.
+    """
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    import mplfinance as mpf
+    begin = int(np.searchsorted(klines['open_time'], start_time))
+    shown = klines[begin:]
+    # column arrays are used as they are, the whole index is converted at once
+    df = pd.DataFrame(
+        {name: shown[name] for name in ['open', 'high', 'low', 'close', 'volume']},
+        index=pd.DatetimeIndex(pd.to_datetime(shown['open_time'], unit='ms', utc=True).tz_convert(timezone), name='date')
+    )
+    addplots = []
+    panel = 1 # 0 is the candles, 1 the volume
+    for name, period in indicators:
+        # all NaN (range shorter than the period) can't be drawn
+        lines = {label: values[begin:] for label, values in compute(klines, name, period).items() if np.isfinite(values[begin:]).any()}
+        if len(lines) == 0:
+            continue
+        overlay = name in OVERLAY_INDICATORS
+        if not overlay:
+            panel += 1
+        for label, values in lines.items():
+            addplots.append(mpf.make_addplot(values, panel=0 if overlay else panel, width=0.8, ylabel="" if overlay else label))
+    # Plot it
+    buffer = io.BytesIO()
+    fig, axlist = mpf.plot(df, figratio=(10, 6), type="candle", tight_layout=True, ylabel = "Precio ($)", returnfig=True, volume=True, style=_style, addplot=addplots)
+    # Add Title
+    axlist[0].set_title(f"{type} - {symbol} - {interval}", fontsize=25, style='italic')
+    fig.savefig(fname=buffer, dpi=CHART_DPI, bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+class ChartRenderer:
+    """
+    Renders charts in a process pool so mplfinance never blocks the event loop.
+    PNGs are cached by (type, symbol, interval, range, last closed candle): the same chart asked again within
+    a candle is served from memory, concurrent requests of the same chart share one render.
+    """
+    def __init__(self, config: Config, logger: Logger):
+        self.config = config
+        self.logger = logger
+        self.pool: ProcessPoolExecutor | None = None
+        self.cache: OrderedDict[tuple, bytes] = OrderedDict()
+        self.inflight: dict[tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.renders = 0
+
+    def get_pool(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            # spawn: a fork would copy the event loop, sockets and threads of the server into every worker
+            self.pool = ProcessPoolExecutor(max_workers=self.config.CHART_WORKERS, mp_context=multiprocessing.get_context("spawn"), initializer=init_worker)
+        return self.pool
+
+    def warm_up(self):
+        """Start the workers now, so the first /fch doesn't pay for spawning them and building the style"""
+        pool = self.get_pool()
+        for _ in range(self.config.CHART_WORKERS):
+            pool.submit(int)
+
+    def cache_key(self, type: str, symbol: str, interval: str, range: int, indicators: tuple) -> tuple:
+        interval_seconds = convert_to_seconds(interval)
+        last_closed_candle = int(time.time()) // interval_seconds * interval_seconds - interval_seconds
+        return (type, symbol, interval, range, indicators, last_closed_candle)
+
+    async def render(self, type: str, symbol: str, interval: str, range: int, load: Callable[[], Awaitable[np.ndarray]], indicators: tuple = ()) -> bytes:
+        """PNG of the chart, load() fetches the klines (warm-up candles included) and is only awaited on a cache miss"""
+        key = self.cache_key(type, symbol, interval, range, indicators)
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        if key in self.inflight:
+            self.hits += 1
+            return await asyncio.shield(self.inflight[key])
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            klines = await load()
+            start_time = int((time.time() - range) * 1000)
+            png = await asyncio.get_running_loop().run_in_executor(self.get_pool(), render, type, symbol, klines, interval, self.config.TIMEZONE, indicators, start_time)
+            self.renders += 1
+            self.cache[key] = png
+            if len(self.cache) > self.config.CHART_CACHE_SIZE:
+                self.cache.popitem(last=False)
+            future.set_result(png)
+            return png
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            future.exception() # retrieved here, waiters get it through await
+            raise
+        finally:
+            self.inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"cached": len(self.cache), "hits": self.hits, "renders": self.renders}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
@@ -2,44 +2,32 @@ from .logger import Logger
 from .config import Config
 from .config import ProxyConfig
 from .notification import Message
-from .util import remove_job_if_exists
+from .util import remove_job_if_exists, convert_to_seconds, Stopwatch
 from telegram import Update, LinkPreviewOptions
 import telegramify_markdown
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes, Application
 import requests
-from .binance_api import BinanceAPI
+from .binance_api import AsyncBinanceAPI, resolve_kline_params
+from .chart import ChartRenderer
+from .kline_store import KlineStore
+from .indicators import parse_indicator
 from .threads import Threads
+from .price_feed import PriceFeed, BinanceMarkPriceSource, ReplayPriceSource
+from .account_mirror import FuturesAccountMirror, BinanceUserDataSource, ReplayUserDataSource
+from .alert import PriceAlert, AlertIndex
+from .state import StateStore
+from .trade_signal import parse_signal
 import json
 import traceback
-import pandas as pd
-import matplotlib.pyplot as plt
-import mplfinance as mpf
-import io
 from datetime import datetime
 import time
 import pytz
 import asyncio
 from collections import defaultdict
-from playwright.async_api import async_playwright, Browser
 
 JOB_NAME_FSTATS = "fstats"
-JOB_NAME_FALERT_TRACK = "falert_track"
 JOB_NAME_FREPLIES_TRACK = "freplies_track"
-class PriceAlert:
-    def __init__(self, op: str, price: float, gap: float = 0.5):
-        self.op = op
-        self.price = price
-        self.gap = gap
-    def __str__(self):
-        return self.op + " " + str(self.price) + f" ({self.gap}%)"
-    def equal(self, price: float):
-        if (abs(self.price - price) / self.price) <= self.gap / 100.0: # check around gap%
-            return True
-        if self.op == '<':
-            return price <= self.price
-        else:
-            return price >= self.price
 class ThreadsReply:
     def __init__(self, url: str, max_timestamp: int):
         self.url = url
@@ -48,37 +36,62 @@ class ThreadsReply:
         return f"{self.url} ({datetime.fromtimestamp(self.max_timestamp, tz=pytz.timezone('Asia/Ho_Chi_Minh'))})"
 EPS = 1e-2
 class Command:
-    def __init__(self, config: Config, logger: Logger, binance_api: BinanceAPI, threads: Threads):
+    def __init__(self, config: Config, logger: Logger, binance_api: AsyncBinanceAPI, threads: Threads, state: StateStore, price_source: BinanceMarkPriceSource | ReplayPriceSource | None = None, user_data_source: BinanceUserDataSource | ReplayUserDataSource | None = None):
         self.config = config
         self.logger = logger
         self.binance_api = binance_api
         self.threads = threads
-        self.map_alert_price = defaultdict(list)
+        self.state = state
+        self.map_alert_price = defaultdict(AlertIndex)
+        for symbol, list_alert in state.load("alert_price").items():
+            for op, price, gap in list_alert:
+                self.map_alert_price[symbol].append(PriceAlert(op, price, gap))
         self.map_tracking_replies = defaultdict(ThreadsReply)
+        for message_id, (url, max_timestamp) in state.load("tracking_replies").items():
+            self.map_tracking_replies[message_id] = ThreadsReply(url, max_timestamp)
+        self.price_feed = PriceFeed(config, logger, price_source or BinanceMarkPriceSource(binance_api), self.f_on_price_tick)
+        self.alert_tracking = state.load("command").get("alert_tracking", False)
+        self.bot = None
+        self.chart = ChartRenderer(config, logger)
+        self.kline_store = KlineStore(config, logger, binance_api)
+        self.account_mirror = FuturesAccountMirror(config, logger, binance_api, user_data_source)
+        self.map_symbol_setting: dict[str, tuple[int, str]] = {} # symbol -> (leverage, margin type: CROSSED/ISOLATED)
+        self.map_staged_order: dict[str, tuple[float, dict, list[dict]]] = {} # /forder args -> (staged at, order, tp/sl orders)
+        self.set_alert_task: set[asyncio.Task] = set() # alerts being sent, referenced until done
         
     async def post_init(self, application: Application):
+        self.bot = application.bot
         self.logger.info("Start server")
+        self.chart.warm_up()
+        self.account_mirror.start()
+        asyncio.create_task(self.f_load_symbol_settings())
+        # resume tracking restored from the state store
+        self.f_alert_subscribe()
+        freplies_interval = self.state.load("command").get("freplies_interval")
+        if len(self.map_tracking_replies) > 0 and freplies_interval:
+            application.job_queue.run_repeating(self.f_get_replies_track, interval=freplies_interval, first=0, name=JOB_NAME_FREPLIES_TRACK)
         await application.bot.set_my_commands([
             ('help', 'Get all commands'),
             ('start', 'Get public, local IP of the server'),
             ('info', 'Get current trade, balance and pnl'),
             ('forder', 'forder market/limit buy/sell coin leverage margin (optional: price_sl:price_tp:price)'),
             ('fclose', 'fclose coin'),
-            ('fch', "Get chart 'fch coin interval(opt, df=15m) range(opt, df=21 * interval)'"),
+            ('fch', "Get chart 'fch coin interval(opt, df=15m) range(opt, df=21 * interval) indicators(opt: ema20 sma50 bb20 rsi14 atr14 vwap)'"),
             ('fp', "Get prices 'fp coin1 coin2 ....'"),
             ('fstats', "Schedule get stats 'fstats interval(seconds)'"),
             ('falert', "falert op1:coin1:price1_1,price1_2,...(:gap1, default=0.5%) ..."),
-            ('falert_track', "Tracking all alert price 'falert_track intervals(seconds)'"),
+            ('falert_track', "Tracking all alert price on the mark price stream 'falert_track'"),
             ('falert_list', "List all current alert"),
             ('falert_remove', "Remove alert 'falert_remove all; coin1:all/index0,index1,... coin2:all/index0,index1,...'"),
             ('freplies', "Set track replies threads 'freplies url message_id'"),
             ('freplies_track', "Tracking all replies threads 'freplies_track interval(seconds)'"),
             ('freplies_list', "List all current replies threads"),
-            ('freplies_remove', "Remove replies 'freplies_remove all; message_id1 message_id2 ...'")
+            ('freplies_remove', "Remove replies 'freplies_remove all; message_id1 message_id2 ...'"),
+            ('fhealth', "Counters of the notification queue, caches and account mirror")
         ])
         try:
             commands = await application.bot.get_my_commands()
-            public_ip = requests.get('https://api.ipify.org', proxies=ProxyConfig(self.config.BINANCE_PROXY_URL).binance_proxies).text
+            public_ip = (await asyncio.to_thread(requests.get, 'https://api.ipify.org', proxies=ProxyConfig(self.config.BINANCE_PROXY_URL).binance_proxies)).text
             msg = f"👋 **Start News - Command Trade - Time: {datetime.fromtimestamp(int(time.time()), tz=pytz.timezone(self.config.TIMEZONE))}**\n"
             msg += f"**Your server public IP is `{public_ip}`, here is list commands:**\n"
             for command in commands:
@@ -97,17 +110,18 @@ class Command:
         msg += "/info - Get current trade, balance and pnl\n"
         msg += "/forder - Make futures market order 'forder market/limit buy/sell coin leverage margin (optional: price_sl:price_tp:price)'\n"
         msg += "/fclose - Close all position and open order 'fclose coin'\n"
-        msg += "/fch - Get chart 'fch coin interval(optional, default=15m) range(optional, default=21 * interval)'\n"
+        msg += "/fch - Get chart 'fch coin interval(optional, default=15m) range(optional, default=21 * interval) indicators(optional: ema20 sma50 bb20 rsi14 atr14 vwap)'\n"
         msg += "/fp - Get prices 'fp coin1 coin2 ....'\n"
         msg += "/fstats - Schedule get stats for current positions 'fstats interval(seconds)'\n"
         msg += "/falert - Set alert price 'falert op1:coin1:price1_1,price1_2,...(:gap1, default=0.5%) ...'\n"
-        msg += "/falert_track - Tracking all alert price 'falert_track intervals(seconds)'\n"
+        msg += "/falert_track - Tracking all alert price on the mark price stream 'falert_track'\n"
         msg += "/falert_list - List all current alert\n"
         msg += "/falert_remove - Remove alert 'falert_remove all; coin1:all/index0,index1,... coin2:all/index0,index1,...'\n"
         msg += "/freplies - Set track replies threads 'freplies url message_id'\n"
         msg += "/freplies_track - Tracking all replies threads 'freplies_track interval(seconds)'\n"
         msg += "/freplies_list - List all current replies threads\n"
-        msg += "/freplies_remove - Remove replies 'freplies_remove all; message_id1 message_id2 ...'"
+        msg += "/freplies_remove - Remove replies 'freplies_remove all; message_id1 message_id2 ...'\n"
+        msg += "/fhealth - Counters of the notification queue (sent, coalesced, dropped, ...), caches (symbol info hits/misses, ...) and account mirror"
         """Handles command /help from the admin"""
         try:
             await update.message.reply_text(text=telegramify_markdown.markdownify(msg), parse_mode=ParseMode.MARKDOWN_V2)
@@ -121,7 +135,7 @@ class Command:
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handles command /start from the admin"""
         try:
-            public_ip = requests.get('https://api.ipify.org', proxies=ProxyConfig(self.config.BINANCE_PROXY_URL).binance_proxies).text
+            public_ip = (await asyncio.to_thread(requests.get, 'https://api.ipify.org', proxies=ProxyConfig(self.config.BINANCE_PROXY_URL).binance_proxies)).text
             await update.message.reply_markdown(text=f"👋 Hello, your server public IP is `{public_ip}`\nCommand `/fstats` interval(seconds) to schedule get stats for current positions")
         except Exception as err:
             self.logger.error(Message(
@@ -132,7 +146,14 @@ class Command:
     
     async def info(self, update: Update, context: ContextTypes.DEFAULT_TYPE): # info current spot/future account, ex: balance, pnl, orders, ...
         try:
-            msg = self.info_spot() + '\n--------------------\n' + self.info_future()[0]
+            account_info, map_price, (futures_account_info, positions) = await asyncio.gather(
+                self.binance_api.get_account(),
+                self.binance_api.get_spot_prices(),
+                self.account_mirror.snapshot()
+            )
+            spot = self.info_spot(account_info, map_price)
+            future = self.info_future(futures_account_info, positions)
+            msg = spot + '\n--------------------\n' + future[0]
             msg = telegramify_markdown.markdownify(msg)
             await update.message.reply_text(text=msg, parse_mode=ParseMode.MARKDOWN_V2, link_preview_options=LinkPreviewOptions(is_disabled=True))
         except Exception as err:
@@ -186,14 +207,29 @@ class Command:
         optional = None
         if len(context.args) > 5:
             optional = context.args[5]
+        stopwatch = Stopwatch()
         try:
             symbol = coin + "USDT"
-            # try to change leverage and margin_type for symbol first
-            self.f_set_leverage_and_margin_type(symbol, leverage)
-            # Try to send original order first, then tp/sl
-            order = self.f_get_order(type, side, symbol, leverage, margin, optional)
+            # leverage/margin type (cached, no call unless it changes) and the entry price are prepared together
+            async def prepare_leverage():
+                with stopwatch.span("leverage"):
+                    await self.f_set_leverage_and_margin_type(symbol, leverage)
+            async def prepare_price():
+                with stopwatch.span("price"):
+                    return await self.f_get_entry_price(type, symbol, optional)
+            # the /forder suggested for a signal was built when the post arrived
+            staged = self.f_pop_staged_order(context.args)
+            if staged is not None:
+                order, staged_tpsl_orders = staged
+                await prepare_leverage()
+            else:
+                _, price = await asyncio.gather(prepare_leverage(), prepare_price())
+                # Try to send original order first, then tp/sl
+                with stopwatch.span("build"):
+                    order = self.f_get_order(type, side, symbol, leverage, margin, price)
             self.logger.info(Message(f"👋 Your origin order for {symbol} is {json.dumps(order)}"))
-            response_origin = self.binance_api.f_order(order)
+            with stopwatch.span("entry"):
+                response_origin = await self.binance_api.f_order(order)
             if "code" in response_origin and int(response_origin["code"]) < 0:
                 # Error
                 self.logger.error(Message(
@@ -205,10 +241,12 @@ class Command:
                 batch_orders = [order]
                 ok = True
                 if optional:
-                    tpsl_orders = self.f_get_tp_sl_orders(order, tpsl_input=optional)
+                    tpsl_orders = staged_tpsl_orders if staged is not None else self.f_get_tp_sl_orders(order, tpsl_input=optional)
                     if len(tpsl_orders) > 0:
                         self.logger.info(Message(f"👋 Your tp/sl order for {symbol} is {json.dumps(tpsl_orders)}"))
-                        responses = self.binance_api.f_batch_order(tpsl_orders)
+                        # one batch for all tp/sl, sent after the entry: reduceOnly orders need the position
+                        with stopwatch.span("tpsl"):
+                            responses = await self.binance_api.f_batch_order(tpsl_orders)
                         for idx in range(len(responses)):
                             if "code" in responses[idx] and int(responses[idx]["code"]) < 0:
                                 # Error
@@ -219,8 +257,9 @@ class Command:
                                 ), notification=True)
                                 ok = False
                         batch_orders.extend(tpsl_orders)
+                self.logger.info(Message(f"⏱ Order pipeline {symbol}: {stopwatch}"))
                 if ok:
-                    await update.message.reply_text(text=f"👋 Your order for {symbol} is successful\n {json.dumps(batch_orders, indent=2)}")
+                    await update.message.reply_text(text=f"👋 Your order for {symbol} is successful\n {json.dumps(batch_orders, indent=2)}\n⏱ {stopwatch}")
         except Exception as err:
             self.logger.error(Message(
                 title=f"Error Command.forder - {type} - {side} - {symbol} - {leverage} - {margin}",
@@ -233,14 +272,16 @@ class Command:
         coin = context.args[0].upper()
         try:
             symbol = coin + "USDT"
-            cancel_open_orders_response = self.binance_api.f_cancel_all_open_orders(symbol)
+            cancel_open_orders_response, batch_orders = await asyncio.gather(
+                self.binance_api.f_cancel_all_open_orders(symbol),
+                self.f_get_close_positions(symbol)
+            )
             msg = f"👋 Cancel all open orders for {symbol}\n {json.dumps(cancel_open_orders_response, indent=2)}\n-------------\n"
 
-            batch_orders = self.f_get_close_positions(symbol)
             self.logger.info(Message(f"👋 Your close positions for {symbol} is {json.dumps(batch_orders)}"))
             if len(batch_orders) > 0:
                 ok = True
-                responses = self.binance_api.f_batch_order(batch_orders)
+                responses = await self.binance_api.f_batch_order(batch_orders)
                 for idx in range(len(responses)):
                     if "code" in responses[idx] and int(responses[idx]["code"]) < 0:
                         # Error
@@ -251,9 +292,10 @@ class Command:
                         ), notification=True)
                         ok = False
                 if ok:
+                    list_user_trades = await asyncio.gather(*(self.binance_api.f_user_trades(symbol, int(response["orderId"])) for response in responses))
                     for idx in range(len(batch_orders)):
                         orderId = int(responses[idx]["orderId"])
-                        userTrades = self.binance_api.f_user_trades(symbol, orderId)
+                        userTrades = list_user_trades[idx]
                         totalPnl = 0.0
                         for trade in userTrades:
                             totalPnl += float(trade["realizedPnl"])
@@ -272,18 +314,27 @@ class Command:
                 chat_id=self.config.TELEGRAM_LOG_PEER_ID
             ), notification=True)
 
-    # fch coin interval(optional, default=15m) range(optional, default=21 * interval)
+    # fch coin interval(optional, default=15m) range(optional, default=21 * interval) indicators(optional, ex: ema20 rsi14 vwap)
     async def fchart(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         coin = context.args[0].upper()
-        interval = context.args[1] if len(context.args) > 1 else None
-        range = context.args[2] if len(context.args) > 2 else None
+        symbol = coin + "USDT"
         try:
-            symbol = coin + "USDT"
-            data, interval = self.binance_api.f_get_historical_klines(symbol, interval, range)
-            ticker_24h = self.binance_api.f_24hr_ticker(symbol)
-            buffer = self.generate_chart("FUTURES", symbol, data, interval)
+            # indicators can be given anywhere after the coin, the other args keep their positions.
+            # Periods are capped by the candles the store keeps
+            parsed = [(arg, parse_indicator(arg, self.config.KLINE_STORE_MAX_CANDLES)) for arg in context.args[1:]]
+            indicators = tuple(indicator for _, indicator in parsed if indicator is not None)
+            args = [arg for arg, indicator in parsed if indicator is None]
+            interval = args[0] if len(args) > 0 else None
+            range = args[1] if len(args) > 1 else None
+            interval, range_seconds = resolve_kline_params(interval, range)
+            # extra candles before the range so the indicators are settled on the first drawn candle
+            warmup_seconds = max((3 * (period or 0) for _, period in indicators), default=0) * convert_to_seconds(interval)
+            png, ticker_24h = await asyncio.gather(
+                self.chart.render("FUTURES", symbol, interval, range_seconds, lambda: self.kline_store.get(symbol, interval, range_seconds + warmup_seconds), indicators),
+                self.binance_api.f_24hr_ticker(symbol)
+            )
             caption_msg = self.build_caption(f"https://www.binance.com/en/futures/{symbol}", symbol, ticker_24h)
-            await update.message.reply_photo(photo=buffer, caption=telegramify_markdown.markdownify(caption_msg), parse_mode=ParseMode.MARKDOWN_V2)
+            await update.message.reply_photo(photo=png, caption=telegramify_markdown.markdownify(caption_msg), parse_mode=ParseMode.MARKDOWN_V2)
         except Exception as err:
             self.logger.error(Message(
                 title=f"Error Command.fchart - {symbol}",
@@ -295,9 +346,9 @@ class Command:
     async def fprices(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             caption_msg = ''
-            for coin in context.args:
-                symbol = coin.upper() + "USDT"
-                ticker_24h = self.binance_api.f_24hr_ticker(symbol)
+            list_symbol = [coin.upper() + "USDT" for coin in context.args]
+            list_ticker_24h = await asyncio.gather(*(self.binance_api.f_24hr_ticker(symbol) for symbol in list_symbol))
+            for symbol, ticker_24h in zip(list_symbol, list_ticker_24h):
                 if len(caption_msg) > 0:
                     caption_msg += '---------------------\n'
                 caption_msg = caption_msg + self.build_caption(f"https://www.binance.com/en/futures/{symbol}", symbol, ticker_24h)
@@ -322,13 +373,41 @@ class Command:
                 chat_id=self.config.TELEGRAM_LOG_PEER_ID
             ), notification=True)
 
+    # fhealth
+    async def fhealth(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        try:
+            msg = f"🩺 Health at **{datetime.fromtimestamp(int(time.time()), tz=pytz.timezone(self.config.TIMEZONE))}**\n"
+            msg += f"```\n{json.dumps(self.f_health(), indent=2)}\n```"
+            await update.message.reply_text(text=telegramify_markdown.markdownify(msg), parse_mode=ParseMode.MARKDOWN_V2)
+        except Exception as err:
+            self.logger.error(Message(
+                title=f"Error Command.fhealth",
+                body=f"Error: {err=}",
+                chat_id=self.config.TELEGRAM_LOG_PEER_ID
+            ), notification=True)
+
+    def f_health(self) -> dict:
+        health = {
+            "symbol_info": self.binance_api.symbol_info.stats(),
+            "ticker_snapshot": self.binance_api.f_ticker_snapshot.stats(),
+            "price_snapshot": self.binance_api.f_price_snapshot.stats(),
+            "spot_price_snapshot": self.binance_api.spot_price_snapshot.stats(),
+            "chart": self.chart.stats(),
+            "kline_store": self.kline_store.stats(),
+            "account_mirror": self.account_mirror.stats(),
+        }
+        if self.logger.NotificationHandler.enabled:
+            health["notification"] = self.logger.NotificationHandler.stats()
+        return health
+
     # falert op1:coin1:price1_1,price1_2,...(:gap1, default=0.5%) op2:coin2:price2_1,price2_2,...(:gap2, default=0.5%)...
     async def falert(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             list_symbol = []
             for input in context.args:
                 list_symbol.append(self.f_alert(input))
-            await update.message.reply_text(text=telegramify_markdown.markdownify(f"👋 Your set alert for **{', '.join(list_symbol)}** successfully\nCommand `/falert_track` interval(seconds) for tracking alert."), parse_mode=ParseMode.MARKDOWN_V2)
+            self.f_alert_subscribe()
+            await update.message.reply_text(text=telegramify_markdown.markdownify(f"👋 Your set alert for **{', '.join(list_symbol)}** successfully\nCommand `/falert_track` for tracking alert."), parse_mode=ParseMode.MARKDOWN_V2)
         except Exception as err:
             self.logger.error(Message(
                 title=f"Error Command.falert - {' '.join(context.args)}",
@@ -350,17 +429,18 @@ class Command:
         for price_str in array[2].split(','):
             price = float(price_str)
             self.map_alert_price[symbol].append(PriceAlert(op, price, gap))
+        self.f_save_alert(symbol)
         return symbol
 
-    # falert_track intervals(seconds)
+    # falert_track
     async def falert_track(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        interval = int(context.args[0])
         try:
-            self.f_alert_track(interval, context)
-            await update.message.reply_text(f"Your alert is tracking, interval={interval}s")
+            self.f_set_alert_tracking(True)
+            self.f_alert_subscribe()
+            await update.message.reply_text(f"Your alert is tracking on mark price stream, symbols={', '.join(sorted(self.price_feed.symbols))}")
         except Exception as err:
             self.logger.error(Message(
-                title=f"Error Command.falert_track - {interval}",
+                title=f"Error Command.falert_track",
                 body=f"Error: {err=}",
                 chat_id=self.config.TELEGRAM_LOG_PEER_ID
             ), notification=True)
@@ -391,9 +471,11 @@ class Command:
             if len(context.args) == 1 and context.args[0] == 'all':
                 list_symbol.append('all symbol')
                 self.map_alert_price.clear()
+                self.state.clear("alert_price")
             else:
                 for input in context.args:
                     list_symbol.append(self.f_alert_remove(input))
+            self.f_alert_subscribe()
             await update.message.reply_text(text=telegramify_markdown.markdownify(f"👋 Your removed alert for **{', '.join(list_symbol)}** successfully\nCommand `/falert_list` to see current alert."), parse_mode=ParseMode.MARKDOWN_V2)
         except Exception as err:
             self.logger.error(Message(
@@ -408,6 +490,7 @@ class Command:
             url = context.args[0]
             message_id = context.args[1]
             self.map_tracking_replies[message_id] = ThreadsReply(url, int(time.time()) - self.config.THREADS_SLA)
+            self.f_save_reply(message_id)
             await update.message.reply_text(text=telegramify_markdown.markdownify(f"👋 Your set track replies for **{url}** to thread {message_id} successfully\nCommand `/freplies_track` interval(seconds) for tracking replies."), parse_mode=ParseMode.MARKDOWN_V2)
         except Exception as err:
             self.logger.error(Message(
@@ -455,10 +538,12 @@ class Command:
             if len(context.args) == 1 and context.args[0] == 'all':
                 list_message_id.append('all message_id')
                 self.map_tracking_replies.clear()
+                self.state.clear("tracking_replies")
             else:
                 for message_id in context.args:
                     list_message_id.append(message_id)
                     self.map_tracking_replies.pop(message_id, 'None')
+                    self.f_save_reply(message_id)
             await update.message.reply_text(text=telegramify_markdown.markdownify(f"👋 Your removed replies for **{', '.join(list_message_id)}** successfully\n{self.build_replies_list}"), parse_mode=ParseMode.MARKDOWN_V2)
         except Exception as err:
             self.logger.error(Message(
@@ -473,15 +558,11 @@ class Command:
             remove_job_if_exists(JOB_NAME_FREPLIES_TRACK, context)
             await context.bot.send_message(chat_id, text=telegramify_markdown.markdownify("👋 You don't have any replies for tracking at this time!\nJob was removed, please command `/freplies_track` interval(seconds) when create a new reply."), parse_mode=ParseMode.MARKDOWN_V2)
             return
-        async with async_playwright() as pw:
-            # start Playwright browser
-            browser: Browser = await pw.chromium.launch(headless=True, chromium_sandbox=False)
-            await asyncio.gather(*(self.f_get_replies(message_id, browser) for message_id in self.map_tracking_replies))
-            await browser.close()
+        await asyncio.gather(*(self.f_get_replies(message_id) for message_id in list(self.map_tracking_replies)))
 
-    async def f_get_replies(self, message_id: str, browser: Browser) -> list[Message]:
+    async def f_get_replies(self, message_id: str) -> list[Message]:
         threads_reply = self.map_tracking_replies[message_id]
-        response = await self.threads.scrape_thread(threads_reply.url, browser, True)
+        response = await self.threads.scrape_thread(threads_reply.url, True)
         if "threads" not in response or len(response["threads"]) == 0:
             return
         thread = response["threads"][0]
@@ -504,6 +585,14 @@ class Command:
             self.logger.info(message, notification=True)
             max_timestamp = reply["published_on"]
         threads_reply.max_timestamp = max_timestamp
+        self.f_save_reply(message_id)
+
+    def f_save_reply(self, message_id: str):
+        if message_id in self.map_tracking_replies:
+            threads_reply = self.map_tracking_replies[message_id]
+            self.state.set("tracking_replies", message_id, [threads_reply.url, threads_reply.max_timestamp])
+        else:
+            self.state.delete("tracking_replies", message_id)
 
     # Format remove: coin:all/index0,index1,...
     def f_alert_remove(self, input: str):
@@ -522,46 +611,67 @@ class Command:
                 self.map_alert_price[symbol].pop(idx_removed)
             if len(self.map_alert_price[symbol]) == 0:
                 self.map_alert_price.pop(symbol, 'None')  
+        self.f_save_alert(symbol)
         return symbol              
 
-    async def f_get_alert_track(self, context: ContextTypes.DEFAULT_TYPE):
-        chat_id = self.config.TELEGRAM_ALERT_CHAT_ID
-        if len(self.map_alert_price) == 0:
-            remove_job_if_exists(JOB_NAME_FALERT_TRACK, context)
-            await context.bot.send_message(chat_id, text=telegramify_markdown.markdownify("👋 You don't have any alert for tracking at this time!\nJob was removed, please command `/falert_track` interval(seconds) when create a new alert."), parse_mode=ParseMode.MARKDOWN_V2)
+    def f_save_alert(self, symbol: str):
+        if symbol in self.map_alert_price:
+            self.state.set("alert_price", symbol, [[price_alert.op, price_alert.price, price_alert.gap] for price_alert in self.map_alert_price[symbol]])
+        else:
+            self.state.delete("alert_price", symbol)
+
+    def f_set_alert_tracking(self, alert_tracking: bool):
+        self.alert_tracking = alert_tracking
+        self.state.set("command", "alert_tracking", alert_tracking)
+
+    def f_alert_subscribe(self):
+        """Keep the mark price stream subscribed to exactly the symbols having alerts"""
+        if self.alert_tracking:
+            self.price_feed.subscribe(self.map_alert_price.keys())
+
+    async def f_on_price_tick(self, symbol: str, price: float):
+        if symbol not in self.map_alert_price:
             return
-        msg = ""
-        list_symbol = []
-        list_removed = []
-        for symbol in self.map_alert_price:
-            ticker_24h = self.binance_api.f_24hr_ticker(symbol)
-            symbol_price = float(ticker_24h['lastPrice'])
-            list_index_remove = []
-            for idx, price_alert in enumerate(self.map_alert_price[symbol]):
-                if price_alert.equal(symbol_price) == False:
-                    continue
-                if len(msg) > 0 and len(list_index_remove) == 0:
-                    msg += '---------------------\n'
-                list_index_remove.append(idx)
+        # removed synchronously so the next tick can't trigger the same alerts again
+        list_triggered = self.map_alert_price[symbol].pop_triggered(price)
+        if len(list_triggered) == 0:
+            return
+        if len(self.map_alert_price[symbol]) == 0:
+            self.map_alert_price.pop(symbol, 'None')
+        self.f_save_alert(symbol)
+        if len(self.map_alert_price) == 0:
+            self.f_set_alert_tracking(False)
+        # sent from its own task: the stop below, or the next subscription once open, cancels the feed task running this callback
+        task = asyncio.create_task(self.f_send_price_alert(symbol, price, list_triggered, len(self.map_alert_price) == 0))
+        self.set_alert_task.add(task)
+        task.add_done_callback(self.set_alert_task.discard)
+        if len(self.map_alert_price) == 0:
+            self.price_feed.stop()
+        else:
+            self.f_alert_subscribe()
+
+    async def f_send_price_alert(self, symbol: str, price: float, list_triggered: list[PriceAlert], stopped: bool):
+        chat_id = self.config.TELEGRAM_ALERT_CHAT_ID
+        try:
+            msg = ""
+            for price_alert in list_triggered:
                 msg += f"🔔 Alert **{symbol}**, setup: **{str(price_alert)}**, chart: `/fch {symbol.removesuffix('USDT')}`\n"
-            if len(list_index_remove) > 0:
-                list_symbol.append(symbol)
-                for idx in sorted(list_index_remove, reverse=True):
-                    list_removed.append((symbol, idx))
-                msg = msg + '\n' + self.build_caption(f"https://www.binance.com/en/futures/{symbol}", symbol, ticker_24h)
-        if msg != "":
-            for removed in list_removed:
-                symbol = removed[0]
-                idx = removed[1]
-                self.map_alert_price[symbol].pop(idx)
-                if len(self.map_alert_price[symbol]) == 0:
-                    self.map_alert_price.pop(symbol, 'None')
-            msg = f"🔔 Price alert {self.config.TELEGRAM_ME}, list: **{', '.join(list_symbol)}**\n\n" + msg
-            await context.bot.send_message(chat_id, text=telegramify_markdown.markdownify(msg), parse_mode=ParseMode.MARKDOWN_V2, link_preview_options=LinkPreviewOptions(is_disabled=True))
-        await asyncio.sleep(1)
+            ticker_24h = await self.binance_api.f_24hr_ticker(symbol)
+            msg = msg + '\n' + self.build_caption(f"https://www.binance.com/en/futures/{symbol}", symbol, ticker_24h)
+            msg = f"🔔 Price alert {self.config.TELEGRAM_ME}, list: **{symbol}**\n\n" + msg
+            await self.bot.send_message(chat_id, text=telegramify_markdown.markdownify(msg), parse_mode=ParseMode.MARKDOWN_V2, link_preview_options=LinkPreviewOptions(is_disabled=True))
+            if stopped:
+                await self.bot.send_message(chat_id, text=telegramify_markdown.markdownify("👋 You don't have any alert for tracking at this time!\nStream was stopped, please command `/falert_track` when create a new alert."), parse_mode=ParseMode.MARKDOWN_V2)
+        except Exception as err:
+            self.logger.error(Message(
+                title=f"Error Command.f_send_price_alert - {symbol} - {price}",
+                body=f"Error: {err=}",
+                chat_id=self.config.TELEGRAM_LOG_PEER_ID
+            ), notification=True)
     
     async def f_get_stats(self, context: ContextTypes.DEFAULT_TYPE):
-        info, totalROI, pnl = self.info_future(True)
+        futures_account_info, positions = await self.account_mirror.snapshot()
+        info, totalROI, pnl = self.info_future(futures_account_info, positions, True)
         chat_id = self.config.TELEGRAM_PNL_CHAT_ID
         if info == "":
             remove_job_if_exists(JOB_NAME_FSTATS, context)
@@ -588,21 +698,19 @@ class Command:
                 chat_id=self.config.TELEGRAM_LOG_PEER_ID
             ), notification=True)
 
-    def info_spot(self):
-        account_info = self.binance_api.get_account()
+    def info_spot(self, account_info: dict, map_price: dict[str, float]):
         total_balance = 0.0
         info = "**SPOT Account**\n"
-        for balance in account_info["balances"]:
+        balances = [balance for balance in account_info["balances"] if float(balance["free"]) + float(balance["locked"]) > EPS]
+        for balance in balances:
             coin = balance["asset"]
             qty = float(balance["free"]) + float(balance["locked"])
-            if qty <= EPS:
-                continue
             message = ""
             if coin == "USDT":
                 message = "**USDT: $%.2f**" % round(qty, 2)
                 total_balance += qty
             else:
-                price = self.binance_api.get_ticker_price(coin + "USDT")
+                price = map_price.get(coin + "USDT", 0.0)
                 balance = qty * price
                 total_balance += balance
                 message = f"**[{coin}](https://www.binance.com/en/trade/{coin}_USDT?type=spot): ${balance:.2f}, qty: {qty:.2f}, price: {price}**"
@@ -612,10 +720,8 @@ class Command:
         info += f"**Total balance: ${total_balance:.2f}**"
         return info
     
-    def info_future(self, skip_info_when_no_positions: bool = False):
+    def info_future(self, account_info: dict, positions: list, skip_info_when_no_positions: bool = False):
         info = "**Future Account**\n"
-        account_info = self.binance_api.get_futures_account()
-        positions = self.binance_api.get_current_position()
         if skip_info_when_no_positions == True and len(positions) == 0:
             return ("", 0, 0)
         for position in positions:
@@ -663,18 +769,21 @@ class Command:
         return order
 
     # market/limit buy/sell coin leverage margin price_sl:price_tp:price (optional)
-    def f_get_order(self, type: str, side: str, symbol: str, leverage: int, margin: float, optional: str | None):
-        price = self.binance_api.f_price(symbol)
+    async def f_get_entry_price(self, type: str, symbol: str, optional: str | None) -> float:
+        """Limit price from the input, otherwise one read of the last price (shared snapshot)"""
+        if 'l' in type.lower():
+            return float(optional.split('_')[0])
+        return await self.binance_api.f_price(symbol)
+
+    def f_get_order(self, type: str, side: str, symbol: str, leverage: int, margin: float, price: float):
         if 'b' in side:
             side_upper = "BUY"
         else:
             side_upper = "SELL"
         if 'l' in type.lower():
             type_upper = "LIMIT"
-            price = float(optional.split('_')[0])
         else:
             type_upper = "MARKET"
-            price = self.binance_api.f_price(symbol)
         return self.f_gen_order(type_upper, side_upper, symbol, leverage, margin, price)
     
     # tpsl format: price_sl:price_tp:price
@@ -695,10 +804,65 @@ class Command:
                 batch_orders.append(tpsl_order)
         return batch_orders
 
-    def f_get_close_positions(self, symbol: str):
-        positions = self.binance_api.get_current_position(symbol=symbol)
+    async def f_enrich_signal(self, message: Message) -> list[str]:
+        """
+        Trade signal of a post as a ready-to-send /forder. The orders are built now, from the cached symbol info
+        and price snapshot, and staged so sending that /forder only places them.
+        """
+        if not self.config.TRADE_SIGNAL_ENABLED:
+            return []
+        signal = parse_signal(message.body, lambda symbol: self.binance_api.f_get_symbol_info(symbol) is not None)
+        if signal is None:
+            return []
+        try:
+            pair_info = self.binance_api.f_get_symbol_info(signal.symbol)
+            price_precision = int(pair_info['pricePrecision']) if pair_info else 4
+            leverage = signal.leverage or self.config.TRADE_SIGNAL_DEFAULT_LEVERAGE
+            margin = self.config.TRADE_SIGNAL_MARGIN
+            # one read of the shared snapshot, market orders use it and every level is checked against it
+            market_price = await self.binance_api.f_price(signal.symbol)
+            if not signal.is_plausible(market_price, self.config.TRADE_SIGNAL_MAX_ENTRY_DEVIATION, self.config.TRADE_SIGNAL_MAX_LEVEL_DEVIATION):
+                self.logger.info(Message(f"🎯 Signal ignored, levels don't fit the price {market_price:g}: {signal}"))
+                return []
+            args = signal.forder_args(leverage, margin, price_precision)
+            type, side = args[0], args[1]
+            optional = args[5] if len(args) > 5 else None
+            price = market_price if signal.entry is None else float(optional.split('_')[0])
+            order = self.f_get_order(type, side, signal.symbol, leverage, margin, price)
+            tpsl_orders = self.f_get_tp_sl_orders(order, tpsl_input=optional) if optional else []
+            self.f_stage_order(args, order, tpsl_orders)
+            if signal.symbol not in self.map_symbol_setting:
+                asyncio.create_task(self.f_load_symbol_setting(signal.symbol))
+            return [f"🎯 {signal}", f"`/forder {' '.join(args)}`"]
+        except Exception as err:
+            self.logger.error(Message(
+                title=f"Error Command.f_enrich_signal - {signal.symbol}",
+                body=f"Error: {err=}",
+                chat_id=self.config.TELEGRAM_LOG_PEER_ID
+            ), notification=True)
+            return []
+
+    def f_stage_order(self, args: list[str], order: dict, tpsl_orders: list[dict]):
+        now = time.time()
+        for key in [key for key, (staged_at, _, _) in self.map_staged_order.items() if now - staged_at > self.config.TRADE_SIGNAL_STAGE_TTL]:
+            del self.map_staged_order[key]
+        self.map_staged_order[" ".join(args).lower()] = (now, order, tpsl_orders)
+
+    def f_pop_staged_order(self, args: list[str]) -> tuple[dict, list[dict]] | None:
+        """Orders staged for exactly these /forder args, None when there are none or they are too old"""
+        staged = self.map_staged_order.pop(" ".join(args).lower(), None)
+        if staged is None or time.time() - staged[0] > self.config.TRADE_SIGNAL_STAGE_TTL:
+            return None
+        _, order, tpsl_orders = staged
+        return dict(order), [dict(tpsl_order) for tpsl_order in tpsl_orders]
+
+    async def f_get_close_positions(self, symbol: str):
+        # quantities to close come from the exchange, a missed fill in the mirror would close the wrong amount
+        positions = await self.binance_api.get_current_position(symbol)
         batch_orders = []
         for position in positions:
+            if abs(float(position["positionAmt"])) == 0: # only open orders
+                continue
             amount = float(position["positionAmt"])
             if amount > 0:
                 side_upper = "BUY"
@@ -713,28 +877,6 @@ class Command:
             batch_orders.append(close_order)
         return batch_orders
     
-    def generate_chart(self, type: str, symbol: str, data: list, interval: str):
-        for line in data:
-            del line[6:]
-            for i in range(1, len(line)):
-                line[i] = float(line[i])
-        df = pd.DataFrame(data, columns=['date', 'open', 'high', 'low', 'close', 'volume'])
-        df['date'] = pd.to_datetime(df['date'], unit='ms', utc=True).map(lambda x: x.tz_convert('Asia/Ho_Chi_Minh'))
-        df.set_index('date', inplace=True)
-        # Plotting
-        # Create my own `marketcolors` style:
-        mc = mpf.make_marketcolors(up='#2fc71e',down='#ed2f1a',inherit=True)
-        # Create my own `MatPlotFinance` style:
-        s  = mpf.make_mpf_style(base_mpl_style=['bmh', 'dark_background'], marketcolors=mc, y_on_right=True)    
-        # Plot it
-        buffer = io.BytesIO()
-        fig, axlist = mpf.plot(df, figratio=(10, 6), type="candle", tight_layout=True, ylabel = "Precio ($)", returnfig=True, volume=True, style=s)
-        # Add Title
-        axlist[0].set_title(f"{type} - {symbol} - {interval}", fontsize=25, style='italic')
-        fig.savefig(fname=buffer, dpi=300, bbox_inches="tight")
-        buffer.seek(0)
-        return buffer
-    
     def build_caption(self, url: str, symbol: str, ticker_24h: dict):
         pair_info = self.binance_api.f_get_symbol_info(symbol)
         price_precision = int(pair_info['pricePrecision']) if pair_info else 4
@@ -750,17 +892,53 @@ class Command:
         remove_job_if_exists(JOB_NAME_FSTATS, context)
         context.job_queue.run_repeating(self.f_get_stats, interval=interval, first=0, name=JOB_NAME_FSTATS)
     
-    def f_alert_track(self, interval: int, context: ContextTypes.DEFAULT_TYPE):
-        remove_job_if_exists(JOB_NAME_FALERT_TRACK, context)
-        context.job_queue.run_repeating(self.f_get_alert_track, interval=interval, first=0, name=JOB_NAME_FALERT_TRACK)
-
     def f_replies_track(self, interval: int, context: ContextTypes.DEFAULT_TYPE):
+        self.state.set("command", "freplies_interval", interval)
         remove_job_if_exists(JOB_NAME_FREPLIES_TRACK, context)
         context.job_queue.run_repeating(self.f_get_replies_track, interval=interval, first=0, name=JOB_NAME_FREPLIES_TRACK)
 
-    def f_set_leverage_and_margin_type(self, symbol: str, leverage: int = 10, margin_type: str = 'CROSSED'):
-        position_info = self.binance_api.get_position_info(symbol)[0]
-        if int(position_info["leverage"]) != leverage:
-            self.binance_api.f_change_leverage(symbol, leverage)
-        if (position_info["marginType"] == "cross" and margin_type != "CROSSED") or (position_info["marginType"] == "isolated" and margin_type != "ISOLATED"):
-            self.binance_api.f_change_margin_type(symbol, margin_type)
\ No newline at end of file
+    def f_cache_symbol_setting(self, position_info: dict):
+        margin_type = "CROSSED" if position_info["marginType"] == "cross" else "ISOLATED"
+        self.map_symbol_setting[position_info["symbol"]] = (int(position_info["leverage"]), margin_type)
+
+    async def f_load_symbol_settings(self):
+        """Pre-warm leverage/margin type of every symbol with one request, so /forder needs none"""
+        try:
+            for position_info in await self.binance_api.get_position_info():
+                self.f_cache_symbol_setting(position_info)
+        except Exception as err:
+            self.logger.error(Message(
+                title="Error Command.f_load_symbol_settings",
+                body=f"Error: {err=}",
+                chat_id=self.config.TELEGRAM_LOG_PEER_ID
+            ), notification=True)
+
+    async def f_load_symbol_setting(self, symbol: str):
+        """Leverage/margin type of one symbol missing from the cache, so its first /forder needs no read"""
+        try:
+            self.f_cache_symbol_setting((await self.binance_api.get_position_info(symbol))[0])
+        except Exception as err:
+            self.logger.error(Message(
+                title=f"Error Command.f_load_symbol_setting - {symbol}",
+                body=f"Error: {err=}",
+                chat_id=self.config.TELEGRAM_LOG_PEER_ID
+            ), notification=True)
+
+    async def f_set_leverage_and_margin_type(self, symbol: str, leverage: int = 10, margin_type: str = 'CROSSED'):
+        if symbol not in self.map_symbol_setting:
+            self.f_cache_symbol_setting((await self.binance_api.get_position_info(symbol))[0])
+        current_leverage, current_margin_type = self.map_symbol_setting[symbol]
+        # changed from the app or another client: the mirror sees ACCOUNT_CONFIG_UPDATE and ACCOUNT_UPDATE
+        current_leverage = self.account_mirror.map_leverage.get(symbol, current_leverage)
+        current_margin_type = self.account_mirror.map_margin_type.get(symbol, current_margin_type)
+        try:
+            if current_leverage != leverage:
+                await self.binance_api.f_change_leverage(symbol, leverage)
+            if current_margin_type != margin_type:
+                await self.binance_api.f_change_margin_type(symbol, margin_type)
+        except Exception:
+            self.map_symbol_setting.pop(symbol, None) # state unknown, read it again next time
+            raise
+        self.map_symbol_setting[symbol] = (leverage, margin_type)
+        self.account_mirror.map_leverage[symbol] = leverage
+        self.account_mirror.map_margin_type[symbol] = margin_type
\ No newline at end of file
@@ -71,6 +71,16 @@ class ProxyConfig:
             proxy["password"] = self.password
         return proxy
 
+    @property
+    def aiohttp_proxy(self) -> str | None:
+        port = self._pick_port()
+        if not port:
+            return None
+        auth = ""
+        if self.username and self.password:
+            auth = f"{self.username}:{self.password}@"
+        return f"{self.scheme}://{auth}{self.host}:{port}"
+
     @property
     def binance_proxies(self) -> dict | None:
         port = self._pick_port()
@@ -110,17 +120,25 @@ class Config:
         load_dotenv(dotenv_path=".env", override=False)
         # Twitter
         self.TWITTER_COOKIES_DICT = json.loads(os.environ.get("TWITTER_COOKIES", "{}"))
+        # one session per cookies dict, TWITTER_COOKIES may be a dict or a list of dicts
+        self.TWITTER_COOKIES_LIST = self.TWITTER_COOKIES_DICT if isinstance(self.TWITTER_COOKIES_DICT, list) else [self.TWITTER_COOKIES_DICT]
         self.TWITTER_LIST_QUERY = [query.strip() for query in os.environ.get("TWITTER_LIST_QUERY", "").split() if query.strip()]
         self.TWITTER_SCRAPE_SLEEP_TIME = int(os.environ.get("TWITTER_SCRAPE_SLEEP_TIME", 600))
         self.TWITTER_SLA = int(os.environ.get("TWITTER_SLA", 86400))
         self.TWITTER_TWEETS_COUNT = int(os.environ.get("TWITTER_TWEETS_COUNT", 5))
         self.TWITTER_ENABLED = os.environ.get("TWITTER_ENABLED", "false").lower() == "true"
+        self.TWITTER_MAX_CONCURRENCY = int(os.environ.get("TWITTER_MAX_CONCURRENCY", 2))
+        self.TWITTER_SESSION_BUDGET = int(os.environ.get("TWITTER_SESSION_BUDGET", 50))
+        self.TWITTER_MAX_QUERY_INTERVAL = int(os.environ.get("TWITTER_MAX_QUERY_INTERVAL", 4))
 
         # Threads
         self.THREADS_LIST_USERNAME = [thread.strip() for thread in os.environ.get("THREADS_LIST_USERNAME", "").split() if thread.strip()]
         self.THREADS_SLA = int(os.environ.get("THREADS_SLA", 600))
         self.THREADS_SCRAPE_SLEEP_TIME = int(os.environ.get("THREADS_SCRAPE_SLEEP_TIME", 60))
         self.THREADS_ENABLED = os.environ.get("THREADS_ENABLED", "false").lower() == "true"
+        self.THREADS_MAX_CONCURRENCY = int(os.environ.get("THREADS_MAX_CONCURRENCY", 4))
+        self.THREADS_BROWSER_MAX_USES = int(os.environ.get("THREADS_BROWSER_MAX_USES", 200))
+        self.THREADS_FETCH_MODE = os.environ.get("THREADS_FETCH_MODE", "http").lower() # http (fallback to browser) or browser
 
         # Telegram
         self.TELEGRAM_API_ID = os.environ.get("TELEGRAM_API_ID", "")
@@ -137,10 +155,22 @@ class Config:
         self.TELEGRAM_LIMIT = int(os.environ.get("TELEGRAM_LIMIT", 10))
         self.TELEGRAM_SLA = int(os.environ.get("TELEGRAM_SLA", 600))
         self.TELEGRAM_SCRAPE_SLEEP_TIME = int(os.environ.get("TELEGRAM_SCRAPE_SLEEP_TIME", 30))
+        self.TELEGRAM_PUSH_ENABLED = os.environ.get("TELEGRAM_PUSH_ENABLED", "true").lower() == "true"
+        self.TELEGRAM_GAP_FILL_SLEEP_TIME = int(os.environ.get("TELEGRAM_GAP_FILL_SLEEP_TIME", 300))
         self.TELEGRAM_ENABLED = os.environ.get("TELEGRAM_ENABLED", "false").lower() == "true"
         self.TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
         self.TELEGRAM_BOT_TRADING_TOKEN = os.environ.get("TELEGRAM_BOT_TRADING_TOKEN", "")
         self.TELEGRAM_ME = os.environ.get("TELEGRAM_ME", "")
+        self.TELEGRAM_COALESCE_WINDOW = float(os.environ.get("TELEGRAM_COALESCE_WINDOW", 0)) # 0 disables coalescing
+        self.TELEGRAM_COALESCE_CHAT_IDS = [int(chat_id) for chat_id in os.environ.get("TELEGRAM_COALESCE_CHAT_IDS", str(self.TELEGRAM_NEWS_PEER_ID)).split() if chat_id.strip()]
+        self.DEDUP_WINDOW = float(os.environ.get("DEDUP_WINDOW", 600)) # 0 disables near-duplicate suppression
+        self.DEDUP_SIMILARITY = float(os.environ.get("DEDUP_SIMILARITY", 0.6))
+        self.IMAGE_FETCH_CONCURRENCY = int(os.environ.get("IMAGE_FETCH_CONCURRENCY", 4))
+        self.IMAGE_CACHE_BYTES = int(os.environ.get("IMAGE_CACHE_BYTES", 64 * 1024 * 1024))
+        self.IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", 10 * 1024 * 1024)) # Telegram rejects larger photos
+        self.TELEGRAM_FILE_ID_CACHE_SIZE = int(os.environ.get("TELEGRAM_FILE_ID_CACHE_SIZE", 5000)) # 0 disables
+        self.ROUTING_RULES = os.environ.get("ROUTING_RULES", "") # JSON, see routing.parse_rules
+        self.DEDUP_CHAT_IDS = [int(chat_id) for chat_id in os.environ.get("DEDUP_CHAT_IDS", str(self.TELEGRAM_NEWS_PEER_ID)).split() if chat_id.strip()]
 
         # Discord
         self.DISCORD_ENABLED = os.environ.get("DISCORD_ENABLED", "false").lower() == "true"
@@ -149,15 +179,33 @@ class Config:
         self.DISCORD_SCRAPE_SLEEP_TIME = int(os.environ.get("DISCORD_SCRAPE_SLEEP_TIME", 60))
         self.DISCORD_LIST_CHANNEL_ID = [channel.strip() for channel in os.environ.get("DISCORD_LIST_CHANNEL_ID", "").split() if channel.strip()]
         self.DISCORD_TOKEN = os.environ.get("DISCORD_TOKEN", "")
+        self.DISCORD_MAX_CONCURRENCY = int(os.environ.get("DISCORD_MAX_CONCURRENCY", 5))
 
         # Binance
         self.BINANCE_API_KEY = os.environ.get("BINANCE_API_KEY", "")
         self.BINANCE_API_SECRET = os.environ.get("BINANCE_API_SECRET", "")
         self.BINANCE_TLD = os.environ.get("BINANCE_TLD", "com")
         self.BINANCE_PROXY_URL = os.environ.get("BINANCE_PROXY_URL", "")
+        self.BINANCE_SYMBOL_INFO_TTL = int(os.environ.get("BINANCE_SYMBOL_INFO_TTL", 3600))
+        self.BINANCE_POOL_SIZE = int(os.environ.get("BINANCE_POOL_SIZE", 20))
+        self.BINANCE_TICKER_TTL = float(os.environ.get("BINANCE_TICKER_TTL", 2))
+        self.CHART_WORKERS = int(os.environ.get("CHART_WORKERS", 2))
+        self.CHART_CACHE_SIZE = int(os.environ.get("CHART_CACHE_SIZE", 64))
+        self.ACCOUNT_MIRROR_ENABLED = os.environ.get("ACCOUNT_MIRROR_ENABLED", "true").lower() == "true"
+        self.ACCOUNT_MIRROR_RECONCILE_INTERVAL = int(os.environ.get("ACCOUNT_MIRROR_RECONCILE_INTERVAL", 300))
+        self.ACCOUNT_MIRROR_STALE_AFTER = int(os.environ.get("ACCOUNT_MIRROR_STALE_AFTER", 30))
+        self.KLINE_STORE_MAX_CANDLES = int(os.environ.get("KLINE_STORE_MAX_CANDLES", 5000))
+        self.TRADE_SIGNAL_ENABLED = os.environ.get("TRADE_SIGNAL_ENABLED", "true").lower() == "true"
+        self.TRADE_SIGNAL_MARGIN = float(os.environ.get("TRADE_SIGNAL_MARGIN", 10))
+        self.TRADE_SIGNAL_DEFAULT_LEVERAGE = int(os.environ.get("TRADE_SIGNAL_DEFAULT_LEVERAGE", 10))
+        self.TRADE_SIGNAL_STAGE_TTL = int(os.environ.get("TRADE_SIGNAL_STAGE_TTL", 120))
+        self.TRADE_SIGNAL_MAX_ENTRY_DEVIATION = float(os.environ.get("TRADE_SIGNAL_MAX_ENTRY_DEVIATION", 0.05))
+        self.TRADE_SIGNAL_MAX_LEVEL_DEVIATION = float(os.environ.get("TRADE_SIGNAL_MAX_LEVEL_DEVIATION", 0.5))
 
         # General
         self.TIMEZONE = os.environ.get("TIMEZONE", "Asia/Ho_Chi_Minh")
+        self.STATE_DB_PATH = os.environ.get("STATE_DB_PATH", "state/crypto_trading_news.db")
+        self.STATE_FLUSH_INTERVAL = float(os.environ.get("STATE_FLUSH_INTERVAL", 5))
 
         # Proxy configs
         self.TOR_PROXY = ProxyConfig(os.environ.get("TOR_PROXY_URL"), int(os.environ.get("TOR_PROXY_NUM_PORTS", 1)))
@@ -172,6 +220,7 @@ class Config:
         response["platform"] = platform.system()
         response["TWITTER_COOKIES_TYPE"] = str(type(response["TWITTER_COOKIES_DICT"]))
         response["TWITTER_COOKIES_DICT"] = "{.....}"
+        response["TWITTER_COOKIES_LIST"] = f"[{len(self.TWITTER_COOKIES_LIST)} sessions]"
         response["TELEGRAM_SESSION_STRING"] = "...."
         response["DISCORD_TOKEN"] = "...."
         response["BINANCE_API_KEY"] = "...."
@@ -0,0 +1,148 @@
+import re
+import time
+import random
+import zlib
+import numpy as np
+from collections import deque
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+MINHASH_PERMUTATIONS = 32
+MINHASH_BAND_ROWS = 4 # 8 bands of 4 rows, LSH candidate threshold ~ (1/8)^(1/4) = 0.6 Jaccard
+MERSENNE_PRIME = (1 << 31) - 1 # 32-bit (crc32) shingle hashes times 31-bit coefficients stay within uint64
+SHINGLE_SIZE = 3
+MIN_TOKENS = 4 # shorter texts are too ambiguous to fingerprint ("long btc")
+URL_MIN_SIMILARITY = 0.2 # a shared url alone isn't enough, two posts about one article may say different things
+TRACKING_PARAMS = {"ref", "ref_src", "si", "fbclid", "gclid"}
+
+# "[Link: url](url)" appended by every source and the "/freplies url" helper, both are source specific
+RE_PERMALINK = re.compile(r"\*{0,2}\[Link: [^\]]*\]\([^)]*\)\*{0,2}|`/freplies [^`]*`")
+RE_URL = re.compile(r"https?://[^\s<>()\[\]`*]+")
+RE_TOKEN = re.compile(r"\w+")
+
+def canonicalize_url(url: str) -> str:
+    """Lower scheme/host, drop www., fragment, trailing slash and tracking params, sort the rest of the query"""
+    parts = urlsplit(url.rstrip(".,;:!?"))
+    host = parts.netloc.lower().removeprefix("www.")
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    return urlunsplit(("https", host, parts.path.rstrip("/"), urlencode(query), ""))
+
+def is_content_url(url: str) -> bool:
+    """A homepage (bare domain, no path nor query) is linked by unrelated posts of the same site"""
+    parts = urlsplit(url)
+    return parts.path not in ("", "/") or parts.query != ""
+
+def normalize(text: str) -> tuple[list[str], frozenset[str]]:
+    """Content tokens and canonical content urls of a message body"""
+    text = RE_PERMALINK.sub(" ", text or "")
+    urls = frozenset(url for url in map(canonicalize_url, RE_URL.findall(text)) if is_content_url(url))
+    tokens = RE_TOKEN.findall(RE_URL.sub(" ", text).lower())
+    return tokens, urls
+
+_rng = random.Random(0x5EED) # fixed seed, signatures must be comparable across restarts
+PERMUTATIONS = [(_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME)) for _ in range(MINHASH_PERMUTATIONS)]
+PERMUTATION_A = np.array([[a] for a, _ in PERMUTATIONS], dtype=np.uint64)
+PERMUTATION_B = np.array([[b] for _, b in PERMUTATIONS], dtype=np.uint64)
+
+def minhash(tokens: list[str]) -> tuple[int, ...]:
+    """MinHash signature of the word shingles, all permutations of all shingles in one array operation"""
+    shingles = {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1))}
+    hashes = np.fromiter((zlib.crc32(shingle.encode()) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    return tuple(((PERMUTATION_A * hashes + PERMUTATION_B) % MERSENNE_PRIME).min(axis=1).tolist())
+
+def similarity(signature: tuple[int, ...], other: tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(signature, other) if x == y) / MINHASH_PERMUTATIONS
+
+class DedupEntry:
+    def __init__(self, seq: int, timestamp: float, source: str, signature: tuple[int, ...] | None, urls: frozenset[str], title: str):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.source = source
+        self.signature = signature
+        self.urls = urls
+        self.title = title
+
+class DedupIndex:
+    """
+    Time-bounded index of recent message signatures.
+    MinHash signatures are split into LSH bands, messages sharing a whole band are candidates and are kept when
+    their estimated Jaccard similarity reaches the threshold, so a lookup is a few dict hits whatever the number
+    of indexed messages. Messages sharing a canonical content url are duplicates too when their texts are at least
+    URL_MIN_SIMILARITY alike, or one of them is too short to compare (a bare link).
+    Matches from the same source are ignored, edits and follow-ups of one feed are not duplicates.
+    """
+    def __init__(self, window: float, threshold: float = 0.6):
+        self.window = window
+        self.threshold = threshold
+        self.bands = MINHASH_PERMUTATIONS // MINHASH_BAND_ROWS
+        self.seq = 0
+        self.entries: deque[DedupEntry] = deque()
+        self.map_band: list[dict[tuple[int, ...], dict[int, DedupEntry]]] = [{} for _ in range(self.bands)]
+        self.map_url: dict[str, dict[int, DedupEntry]] = {}
+        self.hits = 0
+        self.lookups = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _band_values(self, signature: tuple[int, ...]):
+        for band in range(self.bands):
+            yield band, signature[band * MINHASH_BAND_ROWS:(band + 1) * MINHASH_BAND_ROWS]
+
+    def expire(self, now: float):
+        while self.entries and now - self.entries[0].timestamp > self.window:
+            entry = self.entries.popleft()
+            if entry.signature is not None:
+                for band, value in self._band_values(entry.signature):
+                    bucket = self.map_band[band][value]
+                    bucket.pop(entry.seq, None)
+                    if not bucket:
+                        del self.map_band[band][value]
+            for url in entry.urls:
+                bucket = self.map_url[url]
+                bucket.pop(entry.seq, None)
+                if not bucket:
+                    del self.map_url[url]
+
+    def find(self, source: str, signature: tuple[int, ...] | None, urls: frozenset[str]) -> DedupEntry | None:
+        if signature is not None:
+            for band, value in self._band_values(signature):
+                for entry in self.map_band[band].get(value, {}).values():
+                    if entry.source != source and similarity(entry.signature, signature) >= self.threshold:
+                        return entry
+        for url in urls:
+            for entry in self.map_url.get(url, {}).values():
+                if entry.source == source:
+                    continue
+                if signature is None or entry.signature is None or similarity(entry.signature, signature) >= URL_MIN_SIMILARITY:
+                    return entry
+        return None
+
+    def check(self, source: str, text: str, title: str = "", now: float | None = None) -> DedupEntry | None:
+        """Return the earlier entry this text duplicates, otherwise index it and return None"""
+        now = time.time() if now is None else now
+        self.lookups += 1
+        self.expire(now)
+        tokens, urls = normalize(text)
+        signature = minhash(tokens) if len(tokens) >= MIN_TOKENS else None
+        if signature is None and not urls:
+            return None
+        duplicate = self.find(source, signature, urls)
+        if duplicate is not None:
+            self.hits += 1
+            return duplicate
+        entry = DedupEntry(self.seq, now, source, signature, urls, title)
+        self.seq += 1
+        self.entries.append(entry)
+        if signature is not None:
+            for band, value in self._band_values(signature):
+                self.map_band[band].setdefault(value, {})[entry.seq] = entry
+        for url in urls:
+            self.map_url.setdefault(url, {})[entry.seq] = entry
+        return None
+
+    def stats(self) -> dict:
+        return {"size": len(self.entries), "lookups": self.lookups, "hits": self.hits}
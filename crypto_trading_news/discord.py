@@ -1,12 +1,13 @@
 from .logger import Logger
 from .config import Config
 from .notification import Message
-import requests
+import aiohttp
+import asyncio
 import time
-from random import randint
 from datetime import datetime
 import pytz
-from .util import is_command_trade
+from .state import StateStore
+from .routing import Router
 
 BASE_API_URL = "https://discord.com/api/v9"
 
@@ -24,36 +25,67 @@ def iso_to_unix(iso_timestamp: str):
     return unix_timestamp
 
 class Discord:
-    def __init__(self, config: Config, logger: Logger):
+    def __init__(self, config: Config, logger: Logger, state: StateStore, router: Router):
         self.config = config
         self.logger = logger
+        self.state = state
+        self.router = router
         self.map_channel = {}
         self.map_guild = {}
-        self.map_channel_last_message_id = {}
+        self.map_channel_last_message_id = state.load("discord_last_message_id")
         self.base_headers = {"Authorization": self.config.DISCORD_TOKEN}
-        self.init()
-    
-    def get_channel(self, channel_id: str):
-        return requests.get(f"{BASE_API_URL}/channels/{channel_id}", headers=self.base_headers)
+        self.session: aiohttp.ClientSession | None = None
+        self.semaphore = asyncio.Semaphore(config.DISCORD_MAX_CONCURRENCY)
+        self.map_route_reset_at = {} # route -> monotonic time when its rate limit bucket is refilled
+        self.global_reset_at = 0.0
+
+    def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                headers=self.base_headers,
+                connector=aiohttp.TCPConnector(limit=self.config.DISCORD_MAX_CONCURRENCY),
+                timeout=aiohttp.ClientTimeout(total=15)
+            )
+        return self.session
+
+    async def request(self, route: str, params: dict | None = None):
+        """GET paced by the X-RateLimit-* headers of the route instead of fixed sleeps"""
+        async with self.semaphore:
+            for _ in range(3):
+                delay = max(self.global_reset_at, self.map_route_reset_at.get(route, 0.0)) - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                async with self.get_session().get(f"{BASE_API_URL}/{route}", params=params) as response:
+                    if response.status == 429:
+                        payload = await response.json(content_type=None)
+                        reset_at = time.monotonic() + float(payload.get("retry_after", 1))
+                        if payload.get("global"):
+                            self.global_reset_at = reset_at
+                        else:
+                            self.map_route_reset_at[route] = reset_at
+                        continue
+                    response.raise_for_status()
+                    remaining = response.headers.get("X-RateLimit-Remaining")
+                    reset_after = response.headers.get("X-RateLimit-Reset-After")
+                    if remaining is not None and reset_after is not None and int(remaining) == 0:
+                        self.map_route_reset_at[route] = time.monotonic() + float(reset_after)
+                    return await response.json()
+            raise Exception(f"Discord rate limited on {route}")
 
-    def get_guild(self, guild_id: str):
-        return requests.get(f"{BASE_API_URL}/guilds/{guild_id}", headers=self.base_headers)
+    async def get_channel(self, channel_id: str):
+        return await self.request(f"channels/{channel_id}")
+
+    async def get_guild(self, guild_id: str):
+        return await self.request(f"guilds/{guild_id}")
     
-    def init(self):
+    async def init(self):
         try:
-            for channel_id in self.config.DISCORD_LIST_CHANNEL_ID:
-                response = self.get_channel(channel_id)
-                response.raise_for_status()
-                self.map_channel[channel_id] = response.json()
-                time.sleep(randint(2, 5))
-            for channel_id in self.map_channel:
-                channel_info = self.map_channel[channel_id]
-                guild_id = str(channel_info["guild_id"])
-                if guild_id not in self.map_guild:
-                    response = self.get_guild(guild_id)
-                    response.raise_for_status()
-                    self.map_guild[guild_id] = response.json()
-                    time.sleep(randint(3, 7))
+            list_channel_id = self.config.DISCORD_LIST_CHANNEL_ID
+            list_channel = await asyncio.gather(*(self.get_channel(channel_id) for channel_id in list_channel_id))
+            self.map_channel = dict(zip(list_channel_id, list_channel))
+            list_guild_id = list({str(channel_info["guild_id"]) for channel_info in list_channel})
+            list_guild = await asyncio.gather(*(self.get_guild(guild_id) for guild_id in list_guild_id))
+            self.map_guild = dict(zip(list_guild_id, list_guild))
         except Exception as err:
             self.logger.error(Message(
                 title=f"Error Discord.init",
@@ -62,13 +94,13 @@ class Discord:
             ), notification=True)
             self.config.DISCORD_ENABLED = False
 
-    def build_message(self, message, channel_info, guild_info):
+    def build_messages(self, message, channel_info, guild_info) -> list[Message]:
         message_timestamp = iso_to_unix(message['timestamp'])
         url = f"https://discord.com/channels/{guild_info['id']}/{channel_info['id']}/{message['id']}"
-        payload = Message(title= f"Discord - {guild_info['name']}-{channel_info['name']} - Time: {datetime.fromtimestamp(message_timestamp, tz=pytz.timezone(self.config.TIMEZONE))}", body="", chat_id=self.config.TELEGRAM_NEWS_PEER_ID)
+        payload = Message(title= f"Discord - {guild_info['name']}-{channel_info['name']} - Time: {datetime.fromtimestamp(message_timestamp, tz=pytz.timezone(self.config.TIMEZONE))}", body="", chat_id=self.config.TELEGRAM_NEWS_PEER_ID, source=f"discord:{channel_info['id']}")
+        chat_ids = [self.config.TELEGRAM_NEWS_PEER_ID]
         def capture(message):
-            if is_command_trade(message['content']):
-                payload.chat_id = self.config.TELEGRAM_TRADE_PEER_ID
+            chat_ids[:] = self.router.route(message['content'], f"discord:{channel_info['id']}")
             payload.body = f"{message['content']}\n\n[Link: {url}]({url})"
             if 'attachments' in message and len(message['attachments']) > 0:
                 images = []
@@ -82,7 +114,7 @@ class Discord:
             capture(message['message_snapshots'][0]['message'])
         else:
             capture(message)
-        return payload
+        return [payload.copy_to(chat_id) for chat_id in chat_ids]
 
     def filter_messages(self, channel_info, guild_info, response_json) -> list[Message]:
         discord_messages = []
@@ -92,23 +124,23 @@ class Discord:
             message_timestamp = iso_to_unix(message['timestamp'])
             if index == 0:
                 self.map_channel_last_message_id[channel_info["id"]] = message_id
+                self.state.set("discord_last_message_id", channel_info["id"], message_id)
             if time_now - message_timestamp >= self.config.DISCORD_SLA:
                 continue
-            discord_messages.append(self.build_message(message, channel_info, guild_info))
+            discord_messages += self.build_messages(message, channel_info, guild_info)
         return discord_messages
         
-    def get_messages(self, channel_id):
+    async def get_messages(self, channel_id):
         try:
             channel_info = self.map_channel[channel_id]
             guild_info = self.map_guild[str(channel_info["guild_id"])]
-            url = f"{BASE_API_URL}/channels/{channel_id}/messages?limit={self.config.DISCORD_LIMIT}"
+            params = {"limit": self.config.DISCORD_LIMIT}
             if channel_id in self.map_channel_last_message_id:
-                url += f"&after={self.map_channel_last_message_id[channel_id]}"
-            # self.logger.info(Message(f"Threads.get_messages on {guild_info['name']}-{channel_info['name']} with url: {url}"))
+                params["after"] = self.map_channel_last_message_id[channel_id]
+            # self.logger.info(Message(f"Threads.get_messages on {guild_info['name']}-{channel_info['name']} with params: {params}"))
 
-            response = requests.get(url, headers=self.base_headers)
-            response.raise_for_status()
-            return self.filter_messages(channel_info, guild_info, response.json())
+            response_json = await self.request(f"channels/{channel_id}/messages", params)
+            return self.filter_messages(channel_info, guild_info, response_json)
         except Exception as err:
             self.logger.error(Message(
                 title=f"Error Discord.get_messages - {guild_info['name']}-{channel_info['name']}({channel_id})",
@@ -117,12 +149,14 @@ class Discord:
             ), notification=True)
         return []
 
-    def scrape_channel_messages(self):
+    async def scrape_channel_messages(self):
         if self.config.DISCORD_ENABLED == False:
             return
-        messages = []
-        for channel_id in self.map_channel:
-            messages.extend(self.get_messages(channel_id))
-            time.sleep(randint(5, 10))
-        for message in messages:
-            self.logger.info(message, notification=True)
\ No newline at end of file
+        list_messages = await asyncio.gather(*(self.get_messages(channel_id) for channel_id in self.map_channel))
+        for messages in list_messages:
+            for message in messages:
+                self.logger.info(message, notification=True)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
\ No newline at end of file
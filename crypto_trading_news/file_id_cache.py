@@ -0,0 +1,70 @@
+from .state import StateStore
+from collections import OrderedDict
+import time
+
+NAMESPACE = "telegram_file_id"
+DIGEST_PREFIX = "digest:" # keys of content digests, the other keys are urls
+
+class FileIdCache:
+    """
+    file_id Telegram returned for a photo, by source url and by content digest, so sending the same media again
+    references the stored file instead of having Telegram fetch the url or receiving an upload.
+    Bounded LRU persisted in the state store as key -> [file_id, last used], the most recent entries are reloaded.
+    """
+    def __init__(self, state: StateStore | None, max_size: int):
+        self.state = state
+        self.max_size = max_size
+        self.entries: OrderedDict[str, str] = OrderedDict() # key -> file_id
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        if state is not None:
+            stored = sorted(state.load(NAMESPACE).items(), key=lambda item: item[1][1])
+            for key, (file_id, _) in stored[-max_size:] if max_size > 0 else []:
+                self.entries[key] = file_id
+            for key, _ in stored[:max(0, len(stored) - max_size)]:
+                state.delete(NAMESPACE, key)
+
+    def keys(self, url: str | None, digest: str | None) -> list[str]:
+        keys = []
+        if url is not None:
+            keys.append(url)
+        if digest is not None:
+            keys.append(DIGEST_PREFIX + digest)
+        return keys
+
+    def touch(self, key: str):
+        self.entries.move_to_end(key)
+        if self.state is not None:
+            self.state.set(NAMESPACE, key, [self.entries[key], time.time()])
+
+    def get(self, url: str | None, digest: str | None = None) -> str | None:
+        for key in self.keys(url, digest):
+            if key in self.entries:
+                self.hits += 1
+                self.touch(key)
+                return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, file_id: str, url: str | None, digest: str | None = None):
+        if self.max_size <= 0:
+            return
+        for key in self.keys(url, digest):
+            self.entries[key] = file_id
+            self.touch(key)
+        while len(self.entries) > self.max_size:
+            key, _ = self.entries.popitem(last=False)
+            if self.state is not None:
+                self.state.delete(NAMESPACE, key)
+
+    def discard(self, file_id: str):
+        """Telegram refused the file_id (other bot, file gone), every key pointing at it is dropped"""
+        for key in [key for key, value in self.entries.items() if value == file_id]:
+            del self.entries[key]
+            if self.state is not None:
+                self.state.delete(NAMESPACE, key)
+        self.invalidated += 1
+
+    def stats(self) -> dict:
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses, "invalidated": self.invalidated}
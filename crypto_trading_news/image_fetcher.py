@@ -0,0 +1,111 @@
+from .config import Config
+from collections import OrderedDict
+import aiohttp
+import asyncio
+import hashlib
+
+CHUNK_SIZE = 256 * 1024
+
+class ImageFetcher:
+    """
+    Downloads the images Telegram couldn't fetch by url, so they can be uploaded as bytes.
+    One pooled session, reads straight into memory, no temp files.
+    Bytes are cached by content digest up to IMAGE_CACHE_BYTES (LRU), urls point to digests, so a retried send
+    and the same picture posted by several feeds are downloaded once. Concurrent fetches of one url share a download.
+    """
+    def __init__(self, config: Config):
+        self.config = config
+        self.session: aiohttp.ClientSession | None = None
+        self.semaphore = asyncio.Semaphore(config.IMAGE_FETCH_CONCURRENCY)
+        self.cache: OrderedDict[bytes, bytes] = OrderedDict() # digest -> content
+        self.cache_bytes = 0
+        self.map_url: OrderedDict[str, bytes] = OrderedDict() # url -> digest
+        self.inflight: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.downloads = 0
+
+    def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.config.IMAGE_FETCH_CONCURRENCY, keepalive_timeout=60, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+        return self.session
+
+    def digest_of(self, url: str) -> str | None:
+        """Hex digest of the content downloaded for url, None if it wasn't downloaded or was evicted"""
+        digest = self.map_url.get(url)
+        if digest is None or digest not in self.cache:
+            return None
+        return digest.hex()
+
+    def get_cached(self, url: str) -> bytes | None:
+        digest = self.map_url.get(url)
+        if digest is None or digest not in self.cache:
+            return None
+        self.map_url.move_to_end(url)
+        self.cache.move_to_end(digest)
+        return self.cache[digest]
+
+    def put(self, url: str, content: bytes):
+        digest = hashlib.blake2b(content, digest_size=16).digest()
+        if digest not in self.cache:
+            self.cache[digest] = content
+            self.cache_bytes += len(content)
+        self.cache.move_to_end(digest)
+        self.map_url[url] = digest
+        self.map_url.move_to_end(url)
+        while self.cache_bytes > self.config.IMAGE_CACHE_BYTES and len(self.cache) > 1:
+            _, evicted = self.cache.popitem(last=False)
+            self.cache_bytes -= len(evicted)
+        # urls of evicted contents are dropped lazily, bound the map itself
+        while len(self.map_url) > 4 * max(1, len(self.cache)):
+            self.map_url.popitem(last=False)
+
+    async def download(self, url: str) -> bytes:
+        async with self.semaphore:
+            async with self.get_session().get(url) as resp:
+                resp.raise_for_status()
+                if resp.content_length is not None and resp.content_length > self.config.IMAGE_MAX_BYTES:
+                    raise ValueError(f"Image too large: {resp.content_length} bytes")
+                buffer = bytearray()
+                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                    buffer += chunk
+                    if len(buffer) > self.config.IMAGE_MAX_BYTES:
+                        raise ValueError(f"Image larger than {self.config.IMAGE_MAX_BYTES} bytes")
+        self.downloads += 1
+        return bytes(buffer)
+
+    async def fetch(self, url: str) -> bytes:
+        content = self.get_cached(url)
+        if content is not None:
+            self.hits += 1
+            return content
+        if url in self.inflight:
+            self.hits += 1
+        else:
+            self.inflight[url] = asyncio.create_task(self.download_and_put(url))
+        # shield: the download belongs to no caller, a cancelled one mustn't cancel it for the others
+        return await asyncio.shield(self.inflight[url])
+
+    async def download_and_put(self, url: str) -> bytes:
+        try:
+            content = await self.download(url)
+            self.put(url, content)
+            return content
+        finally:
+            self.inflight.pop(url, None)
+
+    async def fetch_all(self, urls: list[str]) -> list[bytes]:
+        """All images of a message at once, IMAGE_FETCH_CONCURRENCY downloads at a time"""
+        return list(await asyncio.gather(*(self.fetch(url) for url in urls)))
+
+    def stats(self) -> dict:
+        return {"cached": len(self.cache), "cached_bytes": self.cache_bytes, "hits": self.hits, "downloads": self.downloads}
+
+    async def close(self):
+        for task in list(self.inflight.values()):
+            task.cancel()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
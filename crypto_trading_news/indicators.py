@@ -0,0 +1,126 @@
+import re
+import math
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# name -> default period, None for indicators without a period
+INDICATOR_DEFAULT_PERIOD = {"ema": 20, "sma": 20, "bb": 20, "rsi": 14, "atr": 14, "vwap": None}
+# smallest meaningful period, a deviation or a smoothed change needs at least two samples
+INDICATOR_MIN_PERIOD = {"ema": 1, "sma": 1, "bb": 2, "rsi": 2, "atr": 2}
+# drawn over the candles, the others get their own panel
+OVERLAY_INDICATORS = {"ema", "sma", "bb", "vwap"}
+RE_INDICATOR = re.compile(r"^(ema|sma|bb|rsi|atr|vwap)(\d*)$")
+MS_PER_DAY = 86_400_000
+
+def parse_indicator(token: str, max_period: int | None = None) -> tuple[str, int | None] | None:
+    """"ema20" -> ("ema", 20), "rsi" -> ("rsi", 14), not an indicator -> None, a period out of range raises"""
+    match = RE_INDICATOR.match(token.lower())
+    if match is None:
+        return None
+    name, period = match.group(1), match.group(2)
+    if INDICATOR_DEFAULT_PERIOD[name] is None:
+        if period:
+            raise Exception(f"{name} takes no period, original input: {token}")
+        return name, None
+    period = int(period) if period else INDICATOR_DEFAULT_PERIOD[name]
+    if max_period is None and period < INDICATOR_MIN_PERIOD[name]:
+        raise Exception(f"Period of {name} should be at least {INDICATOR_MIN_PERIOD[name]}, original input: {token}")
+    if max_period is not None and not INDICATOR_MIN_PERIOD[name] <= period <= max_period:
+        raise Exception(f"Period of {name} should be between {INDICATOR_MIN_PERIOD[name]} and {max_period}, original input: {token}")
+    return name, period
+
+def ema_alpha(x: np.ndarray, alpha: float, initial: float | None = None) -> np.ndarray:
+    """
+    y[t] = alpha * x[t] + (1 - alpha) * y[t-1], y[-1] = initial (default x[0]).
+    Solved blockwise in closed form with cumulative sums; a block is short enough that (1 - alpha)^-len stays
+    far from overflow, so there is no Python loop over the samples.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.empty_like(x)
+    if len(x) == 0:
+        return y
+    decay = 1.0 - alpha
+    previous = x[0] if initial is None else initial
+    if decay <= 0.0:
+        y[:] = x
+        return y
+    block = len(x) if decay == 1.0 else max(1, int(math.log(1e12) / -math.log(decay)))
+    for start in range(0, len(x), block):
+        chunk = x[start:start + block]
+        powers = decay ** np.arange(1, len(chunk) + 1) # (1 - alpha)^(t+1)
+        # y[t] = decay^(t+1) * previous + alpha * sum_k decay^(t-k) * x[k]
+        y[start:start + len(chunk)] = powers * previous + alpha * powers / decay * np.cumsum(chunk / (powers / decay))
+        previous = y[start + len(chunk) - 1]
+    return y
+
+def ema(close: np.ndarray, period: int) -> np.ndarray:
+    return ema_alpha(close, 2.0 / (period + 1))
+
+def sma(close: np.ndarray, period: int) -> np.ndarray:
+    result = np.full(len(close), np.nan)
+    if len(close) >= period:
+        cumsum = np.cumsum(np.insert(close, 0, 0.0))
+        result[period - 1:] = (cumsum[period:] - cumsum[:-period]) / period
+    return result
+
+def wilder(x: np.ndarray, period: int) -> np.ndarray:
+    """Wilder smoothing seeded with the SMA of the first `period` samples, NaN before"""
+    result = np.full(len(x), np.nan)
+    if len(x) >= period:
+        seed = x[:period].mean()
+        result[period - 1] = seed
+        result[period:] = ema_alpha(x[period:], 1.0 / period, seed)
+    return result
+
+def rsi(close: np.ndarray, period: int) -> np.ndarray:
+    if len(close) < 2:
+        return np.full(len(close), np.nan)
+    delta = np.diff(close, prepend=np.nan)[1:]
+    gain = wilder(np.clip(delta, 0, None), period)
+    loss = wilder(np.clip(-delta, 0, None), period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = np.where(loss == 0, 100.0, 100.0 - 100.0 / (1.0 + gain / loss))
+    return np.insert(result, 0, np.nan)
+
+def bollinger(close: np.ndarray, period: int, k: float = 2.0) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    middle = sma(close, period)
+    std = np.full(len(close), np.nan)
+    if len(close) >= period:
+        std[period - 1:] = sliding_window_view(close, period).std(axis=1)
+    return middle + k * std, middle, middle - k * std
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int) -> np.ndarray:
+    previous_close = np.concatenate(([close[0]], close[:-1])) if len(close) > 0 else close
+    true_range = np.maximum(high, previous_close) - np.minimum(low, previous_close)
+    return wilder(true_range, period)
+
+def vwap(open_time: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    """VWAP anchored at every UTC day"""
+    typical_volume = np.cumsum((high + low + close) / 3.0 * volume)
+    cumulative_volume = np.cumsum(volume)
+    # subtract the running totals reached at the start of each day
+    day = open_time // MS_PER_DAY
+    starts = np.flatnonzero(np.diff(day, prepend=day[:1] - 1))
+    start_of = np.repeat(starts, np.diff(np.append(starts, len(day))))
+    base_typical_volume = np.where(start_of > 0, typical_volume[start_of - 1], 0.0)
+    base_volume = np.where(start_of > 0, cumulative_volume[start_of - 1], 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (typical_volume - base_typical_volume) / (cumulative_volume - base_volume)
+
+def compute(klines: np.ndarray, name: str, period: int | None) -> dict[str, np.ndarray]:
+    """Lines of one indicator over a KLINE_DTYPE array, label -> values aligned with klines"""
+    close = klines['close']
+    if name == "ema":
+        return {f"EMA{period}": ema(close, period)}
+    if name == "sma":
+        return {f"SMA{period}": sma(close, period)}
+    if name == "bb":
+        upper, middle, lower = bollinger(close, period)
+        return {f"BB{period} upper": upper, f"BB{period}": middle, f"BB{period} lower": lower}
+    if name == "rsi":
+        return {f"RSI{period}": rsi(close, period)}
+    if name == "atr":
+        return {f"ATR{period}": atr(klines['high'], klines['low'], close, period)}
+    if name == "vwap":
+        return {"VWAP": vwap(klines['open_time'], klines['high'], klines['low'], close, klines['volume'])}
+    raise ValueError(f"Unknown indicator {name}")
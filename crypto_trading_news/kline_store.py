@@ -0,0 +1,116 @@
+from .logger import Logger
+from .config import Config
+from .binance_api import AsyncBinanceAPI
+from .util import convert_to_seconds
+from collections import defaultdict
+import numpy as np
+import asyncio
+import time
+
+KLINE_DTYPE = np.dtype([
+    ('open_time', 'i8'),
+    ('open', 'f8'),
+    ('high', 'f8'),
+    ('low', 'f8'),
+    ('close', 'f8'),
+    ('volume', 'f8'),
+])
+KLINES_PAGE_LIMIT = 1500 # max klines per futures request
+
+def decode_klines(rows: list) -> np.ndarray:
+    """Binance kline rows ([open_time, "open", "high", "low", "close", "volume", ...]) to a structured array"""
+    klines = np.empty(len(rows), dtype=KLINE_DTYPE)
+    if len(rows) == 0:
+        return klines
+    # one C-level parse of the numeric strings instead of a float() per cell
+    columns = np.array([row[:6] for row in rows], dtype=np.float64)
+    klines['open_time'] = columns[:, 0].astype(np.int64)
+    for i, name in enumerate(KLINE_DTYPE.names[1:], start=1):
+        klines[name] = columns[:, i]
+    return klines
+
+class KlineSeries:
+    """Growable array of one (symbol, interval), ascending by open_time, slices are views not copies"""
+    def __init__(self):
+        self.buffer = np.empty(0, dtype=KLINE_DTYPE)
+        self.size = 0
+
+    @property
+    def klines(self) -> np.ndarray:
+        return self.buffer[:self.size]
+
+    def merge(self, klines: np.ndarray, max_candles: int):
+        """Append klines, the stored rows from klines[0] on are replaced (the last stored candle may still be open)"""
+        if len(klines) == 0:
+            return
+        if self.size > 0 and klines['open_time'][0] < self.buffer['open_time'][0]:
+            # older history than stored: rebuild from the fresh download
+            self.buffer, self.size = np.empty(0, dtype=KLINE_DTYPE), 0
+        keep = int(np.searchsorted(self.klines['open_time'], klines['open_time'][0]))
+        size = keep + len(klines)
+        if size > len(self.buffer):
+            buffer = np.empty(max(size, 2 * len(self.buffer)), dtype=KLINE_DTYPE)
+            buffer[:keep] = self.buffer[:keep]
+            self.buffer = buffer
+        self.buffer[keep:size] = klines
+        self.size = size
+        if self.size > 2 * max_candles:
+            # compact rarely, slices handed out before keep their own reference to the old buffer
+            self.buffer = self.buffer[self.size - max_candles:self.size].copy()
+            self.size = max_candles
+
+class KlineStore:
+    """
+    Local futures klines per (symbol, interval).
+    A query only downloads the candles newer than the last stored one (that one included, it may have been open),
+    the full range is downloaded only when it starts before the stored history.
+    """
+    def __init__(self, config: Config, logger: Logger, binance_api: AsyncBinanceAPI):
+        self.config = config
+        self.logger = logger
+        self.binance_api = binance_api
+        self.map_series: dict[tuple[str, str], KlineSeries] = defaultdict(KlineSeries)
+        self.map_lock: dict[tuple[str, str], asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.fetched = 0
+        self.served = 0
+
+    async def fetch_from(self, symbol: str, interval: str, start_time: int) -> np.ndarray:
+        pages = []
+        interval_ms = convert_to_seconds(interval) * 1000
+        now_ms = int(time.time() * 1000)
+        while start_time <= now_ms:
+            rows = await self.binance_api.f_klines(symbol, interval, start_time, KLINES_PAGE_LIMIT)
+            if len(rows) == 0:
+                break
+            pages.append(decode_klines(rows))
+            if len(rows) < KLINES_PAGE_LIMIT:
+                break
+            start_time = int(rows[-1][0]) + interval_ms
+        klines = np.concatenate(pages) if pages else np.empty(0, dtype=KLINE_DTYPE)
+        self.fetched += len(klines)
+        return klines
+
+    async def get(self, symbol: str, interval: str, range: int) -> np.ndarray:
+        """Klines opened within the last `range` seconds, a view on the stored array"""
+        key = (symbol, interval)
+        start_time = int((time.time() - range) * 1000)
+        async with self.map_lock[key]:
+            series = self.map_series[key]
+            stored = series.klines
+            if series.size == 0 or start_time < stored['open_time'][0]:
+                klines = await self.fetch_from(symbol, interval, start_time)
+            else:
+                klines = await self.fetch_from(symbol, interval, int(stored['open_time'][-1]))
+            series.merge(klines, max(self.config.KLINE_STORE_MAX_CANDLES, len(klines)))
+            stored = series.klines
+        begin = int(np.searchsorted(stored['open_time'], start_time))
+        self.served += len(stored) - begin
+        return stored[begin:]
+
+    def stats(self) -> dict:
+        return {
+            "series": len(self.map_series),
+            "candles": sum(series.size for series in self.map_series.values()),
+            "fetched": self.fetched,
+            "served": self.served,
+        }
@@ -1,7 +1,9 @@
 import json
 import asyncio
-import aiohttp
-import aiofiles
+import itertools
+import copy
+from datetime import timedelta
+from typing import Awaitable, Callable
 
 from telegram import (
     Bot,
@@ -9,13 +11,31 @@ from telegram import (
     LinkPreviewOptions
 )
 from telegram.constants import ParseMode
-from telegram.error import TelegramError
+from telegram.error import TelegramError, RetryAfter
 from telegram.request import HTTPXRequest
 from .config import Config
+from .util import TokenBucket
+from .dedup import DedupIndex
+from .image_fetcher import ImageFetcher
+from .file_id_cache import FileIdCache
+from .state import StateStore
 import telegramify_markdown
 
+# priority lanes, lower is sent first
+LANE_TRADE = 0
+LANE_ALERT = 1
+LANE_NEWS = 2
+LANE_LOG = 3
+
+# https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+TELEGRAM_GLOBAL_RATE = 30 # messages per second for the whole bot
+TELEGRAM_CHAT_RATE = 1 # messages per second for one private chat
+TELEGRAM_GROUP_RATE = 20 / 60 # messages per second for one group/channel
+MAX_RETRY_AFTER = 5
+TELEGRAM_MAX_TEXT_LENGTH = 4096
+
 class Message:
-    def __init__(self, body: str, chat_id: int = 0, title = 'News Trade', format: str | None = ParseMode.MARKDOWN_V2, image: str | None = None, images: list[str] | None = None, group_message_id: int | None = None):
+    def __init__(self, body: str, chat_id: int = 0, title = 'News Trade', format: str | None = ParseMode.MARKDOWN_V2, image: str | None = None, images: list[str] | None = None, group_message_id: int | None = None, lane: int | None = None, source: str | None = None):
         self.title = title
         self.body = body
         self.format = format
@@ -23,6 +43,8 @@ class Message:
         self.images = images
         self.chat_id = chat_id
         self.group_message_id = group_message_id
+        self.lane = lane
+        self.source = source # feed the message comes from, ex: twitter:username, used by dedup
     def __str__(self):
         payload = {
             "title": self.title,
@@ -34,16 +56,36 @@ class Message:
             "group_message_id": self.group_message_id
         }
         return json.dumps(payload)
+    def copy_to(self, chat_id: int) -> "Message":
+        """Same message for another chat"""
+        message = copy.copy(self)
+        message.chat_id = chat_id
+        return message
     def build_text_notify(self):
         return f"**{self.title}**\n{self.body}"
 
 
 class NotificationHandler:
-    def __init__(self, cfg: Config, enabled=True):
+    def __init__(self, cfg: Config, enabled=True, state: StateStore | None = None):
         if enabled:
             self.config = cfg
-            self.queue = asyncio.Queue()
+            # (lane, seq, message), seq keeps FIFO inside a lane
+            self.queue = asyncio.PriorityQueue()
             self.enabled = True
+            self.seq = itertools.count()
+            self.global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_RATE)
+            self.chat_queues: dict[int, asyncio.PriorityQueue] = {}
+            self.chat_workers: dict[int, asyncio.Task] = {}
+            self.sent = 0
+            self.retry_after = 0
+            self.coalesce_saved = 0
+            self.dropped = 0
+            self.map_dedup: dict[int, DedupIndex] = {} # chat_id -> index, a story sent to one chat is new to the others
+            self.image_fetcher = ImageFetcher(cfg)
+            self.file_ids = FileIdCache(state, cfg.TELEGRAM_FILE_ID_CACHE_SIZE)
+            # async message -> extra lines for the trade chat, ex: the /forder of a signal
+            self.enrichers: list[Callable[[Message], Awaitable[list[str]]]] = []
+            self.enriched = 0
 
             # proxy if needed
             request = HTTPXRequest(
@@ -56,45 +98,23 @@ class NotificationHandler:
             self.enabled = False
 
     async def notify(self, message: Message):
-        text_msg = message.build_text_notify()
-        if message.format is not None:
-            text_msg = telegramify_markdown.markdownify(text_msg)
+        text_msg = self.format_text(message.build_text_notify(), message.format)
 
         try:
             # case: multiple images
             if message.images and len(message.images) > 1:
-                list_media = []
-                for index, image in enumerate(message.images):
-                    if index == 0:
-                        list_media.append(InputMediaPhoto(
-                            media=image,
-                            caption=text_msg,
-                            parse_mode=message.format
-                        ))
-                    else:
-                        list_media.append(InputMediaPhoto(media=image))
-
-                await self.bot.send_media_group(chat_id = message.chat_id, media=list_media, reply_to_message_id=message.group_message_id)
+                await self.send_images(message, message.images, text_msg)
 
             # case: single image
             elif message.image:
-                try:
-                    await self.bot.send_photo(chat_id = message.chat_id, photo=message.image, caption = text_msg, parse_mode=message.format, reply_to_message_id=message.group_message_id)
-                except TelegramError:
-                    # fallback: download then send
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(message.image) as resp:
-                            resp.raise_for_status()  # Raise exception for HTTP errors
-                            async with aiofiles.open("photo.png", "wb") as file:
-                                async for chunk in resp.content.iter_chunked(1024):
-                                    await file.write(chunk)
-
-                    await self.bot.send_photo(chat_id = message.chat_id, photo="photo.png", caption = text_msg, parse_mode=message.format, reply_to_message_id=message.group_message_id)
+                await self.send_images(message, [message.image], text_msg)
 
             # case: text only
             else:
                 await self.bot.send_message(chat_id = message.chat_id, text=text_msg, parse_mode=message.format, link_preview_options=LinkPreviewOptions(is_disabled=True), reply_to_message_id=message.group_message_id)
 
+        except RetryAfter:
+            raise # handled by dispatch, the message is sent again once the chat is allowed
         except Exception as err:
             # fallback error notification
             await self.bot.send_message(
@@ -105,11 +125,197 @@ class NotificationHandler:
                 link_preview_options=LinkPreviewOptions(is_disabled=True)
             )
 
+    async def send_images(self, message: Message, urls: list[str], caption: str):
+        """
+        Known media go out as their file_id, the others as urls for Telegram to fetch.
+        If Telegram refuses, the images are downloaded and uploaded, unless the same content already has a file_id.
+        The file_ids Telegram returns are kept for the next sends.
+        """
+        photos = [self.file_ids.get(url, self.image_fetcher.digest_of(url)) or url for url in urls]
+        try:
+            sent = await self.send_photos(message, photos, caption)
+        except RetryAfter:
+            raise
+        except TelegramError:
+            for url, photo in zip(urls, photos):
+                if photo != url:
+                    self.file_ids.discard(photo)
+            # fallback: download every image at once then upload the bytes
+            contents = await self.image_fetcher.fetch_all(urls)
+            photos = [self.file_ids.get(None, self.image_fetcher.digest_of(url)) or content for url, content in zip(urls, contents)]
+            sent = await self.send_photos(message, photos, caption)
+        for url, sent_message in zip(urls, sent):
+            if sent_message.photo:
+                # largest size last, any size of the photo works as file_id
+                self.file_ids.put(sent_message.photo[-1].file_id, url, self.image_fetcher.digest_of(url))
+
+    async def send_photos(self, message: Message, photos: list[str | bytes], caption: str) -> list:
+        if len(photos) == 1:
+            return [await self.bot.send_photo(chat_id = message.chat_id, photo=photos[0], caption = caption, parse_mode=message.format, reply_to_message_id=message.group_message_id)]
+        return list(await self.bot.send_media_group(chat_id = message.chat_id, media=self.build_media_group(photos, caption, message.format), reply_to_message_id=message.group_message_id))
+
+    def build_media_group(self, images: list[str | bytes], caption: str, format: str | None) -> list[InputMediaPhoto]:
+        """Urls, file_ids or contents, the caption goes on the first photo"""
+        list_media = []
+        for index, image in enumerate(images):
+            if index == 0:
+                list_media.append(InputMediaPhoto(
+                    media=image,
+                    caption=caption,
+                    parse_mode=format
+                ))
+            else:
+                list_media.append(InputMediaPhoto(media=image))
+        return list_media
+
+    def lane(self, message: Message) -> int:
+        if message.lane is not None:
+            return message.lane
+        if message.chat_id == self.config.TELEGRAM_TRADE_PEER_ID:
+            return LANE_TRADE
+        if message.chat_id == self.config.TELEGRAM_ALERT_CHAT_ID:
+            return LANE_ALERT
+        if message.chat_id == self.config.TELEGRAM_LOG_PEER_ID:
+            return LANE_LOG
+        return LANE_NEWS
+
     async def process_queue(self):
+        """
+        Route every message to the worker of its chat. One worker per chat keeps the order inside a chat
+        and its rate limit, so a burst of news never holds back the trade chat.
+        """
         while True:
-            message: Message = await self.queue.get()
-            await self.notify(message)
+            item = await self.queue.get()
+            chat_id = item[2].chat_id
+            if chat_id not in self.chat_queues:
+                self.chat_queues[chat_id] = asyncio.PriorityQueue()
+                self.chat_workers[chat_id] = asyncio.create_task(self.chat_worker(chat_id))
+            self.chat_queues[chat_id].put_nowait(item)
 
-    def send_notification(self, message: Message, attachments=None):
+    async def chat_worker(self, chat_id: int):
+        queue = self.chat_queues[chat_id]
+        # negative ids are groups and channels
+        rate = TELEGRAM_GROUP_RATE if chat_id < 0 else TELEGRAM_CHAT_RATE
+        bucket = TokenBucket(rate, 3 if chat_id < 0 else 1)
+        while True:
+            lane, _, message = await queue.get()
+            if self.can_coalesce(message):
+                message = await self.coalesce(queue, message)
+            if self.can_enrich(message):
+                lines = await self.enrich(message)
+                if lines:
+                    message.body += "\n\n" + "\n".join(lines)
+            try:
+                await self.dispatch(message, lane, bucket)
+            except Exception as err:
+                # notify already tried to report the failure to the chat itself
+                self.drop(message, f"Error: {err=}")
+
+    def can_coalesce(self, message: Message) -> bool:
+        return (
+            self.config.TELEGRAM_COALESCE_WINDOW > 0
+            and message.chat_id in self.config.TELEGRAM_COALESCE_CHAT_IDS
+            and message.chat_id != self.config.TELEGRAM_TRADE_PEER_ID
+            and not message.image and not message.images
+            and message.group_message_id is None
+        )
+
+    async def coalesce(self, queue: asyncio.PriorityQueue, message: Message) -> Message:
+        """Merge the text-only messages of the same chat arriving within the window into one send"""
+        await asyncio.sleep(self.config.TELEGRAM_COALESCE_WINDOW)
+        list_message = [message]
+        while not queue.empty():
+            item = queue.get_nowait()
+            candidate = item[2]
+            if not self.can_coalesce(candidate) or candidate.format != message.format or len(self.format_text(self.merge(list_message + [candidate]).build_text_notify(), message.format)) > TELEGRAM_MAX_TEXT_LENGTH:
+                queue.put_nowait(item) # same (lane, seq) so it keeps its place
+                break
+            list_message.append(candidate)
+        if len(list_message) == 1:
+            return message
+        self.coalesce_saved += len(list_message) - 1
+        return self.merge(list_message)
+
+    def add_enricher(self, enricher: Callable[[Message], Awaitable[list[str]]]):
         if self.enabled:
-            self.queue.put_nowait(message)
\ No newline at end of file
+            self.enrichers.append(enricher)
+
+    def can_enrich(self, message: Message) -> bool:
+        """Posts of a feed routed to the trade chat, not the bot's own messages"""
+        return self.enabled and message.chat_id == self.config.TELEGRAM_TRADE_PEER_ID and message.source is not None
+
+    async def enrich(self, message: Message) -> list[str]:
+        lines = []
+        for enricher in self.enrichers:
+            try:
+                lines += await enricher(message)
+            except Exception:
+                pass # the post still goes out as it is, enrichers report their own errors
+        if lines:
+            self.enriched += 1
+        return lines
+
+    def merge(self, list_message: list[Message]) -> Message:
+        # every message keeps its own title in the body, the merged one only summarizes them
+        titles = {m.title for m in list_message}
+        return Message(
+            title=f"{titles.pop()} - {len(list_message)} messages" if len(titles) == 1 else f"{len(list_message)} messages",
+            body="\n\n".join(m.build_text_notify() for m in list_message),
+            chat_id=list_message[0].chat_id,
+            format=list_message[0].format,
+            lane=list_message[0].lane
+        )
+
+    def format_text(self, text: str, format: str | None) -> str:
+        if format is not None:
+            return telegramify_markdown.markdownify(text)
+        return text
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "retry_after": self.retry_after, "coalesce_saved": self.coalesce_saved, "dropped": self.dropped, "enriched": self.enriched, "dedup": {chat_id: dedup.stats() for chat_id, dedup in self.map_dedup.items()}, "images": self.image_fetcher.stats(), "file_ids": self.file_ids.stats()}
+
+    def is_duplicate(self, message: Message) -> bool:
+        """Whether the same news already went out to this chat from another source within DEDUP_WINDOW, indexes it otherwise"""
+        if (
+            not self.enabled
+            or self.config.DEDUP_WINDOW <= 0
+            or message.source is None
+            or message.chat_id not in self.config.DEDUP_CHAT_IDS
+        ):
+            return False
+        if message.chat_id not in self.map_dedup:
+            self.map_dedup[message.chat_id] = DedupIndex(self.config.DEDUP_WINDOW, self.config.DEDUP_SIMILARITY)
+        return self.map_dedup[message.chat_id].check(message.source, message.body, message.title) is not None
+
+    async def dispatch(self, message: Message, lane: int, bucket: TokenBucket):
+        for _ in range(MAX_RETRY_AFTER):
+            await bucket.acquire(lane)
+            await self.global_bucket.acquire(lane)
+            try:
+                await self.notify(message)
+                self.sent += 1
+                return
+            except RetryAfter as err:
+                self.retry_after += 1
+                delay = err.retry_after.total_seconds() if isinstance(err.retry_after, timedelta) else float(err.retry_after)
+                bucket.pause(delay)
+        self.drop(message, f"Still rate limited after {MAX_RETRY_AFTER} retries")
+
+    def drop(self, message: Message, reason: str):
+        """Count an undeliverable message and report it to the log chat, unless the log chat is the one failing"""
+        self.dropped += 1
+        if message.chat_id == self.config.TELEGRAM_LOG_PEER_ID:
+            return
+        self.send_notification(Message(
+            title=f"Dropped message - {message.chat_id} - {message.title}",
+            body=f"{reason}\n\n{message.body[:1000]}",
+            chat_id=self.config.TELEGRAM_LOG_PEER_ID
+        ))
+
+    async def close(self):
+        if self.enabled:
+            await self.image_fetcher.close()
+
+    def send_notification(self, message: Message, attachments=None):
+        if self.enabled and not self.is_duplicate(message):
+            self.queue.put_nowait((self.lane(message), next(self.seq), message))
\ No newline at end of file
@@ -0,0 +1,119 @@
+from .logger import Logger
+from .config import Config
+from .notification import Message
+from .binance_api import AsyncBinanceAPI
+from binance import BinanceSocketManager
+from typing import AsyncIterator, Awaitable, Callable, Iterable
+import asyncio
+import json
+
+class BinanceMarkPriceSource:
+    """Mark price ticks from the futures combined stream, one `<symbol>@markPrice@1s` stream per symbol"""
+    def __init__(self, binance_api: AsyncBinanceAPI):
+        self.binance_api = binance_api
+
+    async def stream(self, symbols: list[str], on_open: Callable[[], None] | None = None) -> AsyncIterator[tuple[str, float]]:
+        """on_open runs once subscribed"""
+        bm = BinanceSocketManager(self.binance_api.binance_client)
+        streams = [f"{symbol.lower()}@markPrice@1s" for symbol in symbols]
+        async with bm.futures_multiplex_socket(streams) as socket:
+            if on_open is not None:
+                on_open()
+            while True:
+                msg = await socket.recv()
+                data = msg.get("data", msg) if msg else None
+                if not data:
+                    continue
+                if data.get("e") == "error":
+                    raise Exception(data.get("m"))
+                if data.get("e") != "markPriceUpdate":
+                    continue
+                yield data["s"], float(data["p"])
+
+class ReplayPriceSource:
+    """
+    Local stand-in for the websocket, replays recorded ticks so alerts can be exercised offline.
+    ticks: list of (symbol, price) or path to a JSON lines file of markPriceUpdate payloads ({"s": ..., "p": ...})
+    """
+    def __init__(self, ticks: list[tuple[str, float]] | str, delay: float = 0.0):
+        if isinstance(ticks, str):
+            with open(ticks, "r") as file:
+                payloads = [json.loads(line) for line in file if line.strip()]
+            ticks = [(payload.get("data", payload)["s"], float(payload.get("data", payload)["p"])) for payload in payloads]
+        self.ticks = ticks
+        self.delay = delay
+
+    async def stream(self, symbols: list[str], on_open: Callable[[], None] | None = None) -> AsyncIterator[tuple[str, float]]:
+        if on_open is not None:
+            on_open()
+        wanted = set(symbols)
+        for symbol, price in self.ticks:
+            if symbol not in wanted:
+                continue
+            yield symbol, price
+            await asyncio.sleep(self.delay)
+
+class PriceFeed:
+    """
+    Keeps one subscription for the current set of symbols and calls on_tick for every price.
+    A new subscription is opened before the replaced one is closed, so the symbols in both keep ticking
+    meanwhile; on_tick may then see a price twice.
+    """
+    def __init__(self, config: Config, logger: Logger, source: BinanceMarkPriceSource | ReplayPriceSource, on_tick: Callable[[str, float], Awaitable[None]]):
+        self.config = config
+        self.logger = logger
+        self.source = source
+        self.on_tick = on_tick
+        self.symbols: frozenset[str] = frozenset()
+        self.ticks = 0
+        self._task: asyncio.Task | None = None
+        self._retiring: list[asyncio.Task] = [] # replaced subscriptions, closed once the new one is open
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def subscribe(self, symbols: Iterable[str]):
+        """Re-subscribe when the symbol set changed, an empty set stops the feed"""
+        symbols = frozenset(symbols)
+        if symbols == self.symbols and (self.running or len(symbols) == 0):
+            return
+        self.symbols = symbols
+        if self._task is not None:
+            self._retiring.append(self._task)
+            self._task = None
+        if len(symbols) > 0:
+            self._task = asyncio.create_task(self.run(symbols))
+        else:
+            # nothing to hand over, may cancel the task calling it, so it must be its last step
+            for task in self._retiring:
+                task.cancel()
+            self._retiring = []
+
+    def stop(self):
+        self.subscribe([])
+
+    def retire(self):
+        """Close the replaced subscriptions, except the calling one if a newer subscription replaced it too"""
+        current = asyncio.current_task()
+        for task in self._retiring:
+            if task is not current:
+                task.cancel()
+        self._retiring = [task for task in self._retiring if task is current]
+
+    async def run(self, symbols: frozenset[str]):
+        while True:
+            try:
+                async for symbol, price in self.source.stream(sorted(symbols), self.retire):
+                    self.ticks += 1
+                    await self.on_tick(symbol, price)
+                return # replay source exhausted
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                self.logger.error(Message(
+                    title=f"Error PriceFeed.run - {', '.join(sorted(symbols))}",
+                    body=f"Error: {err=}\nReconnect after 5s",
+                    chat_id=self.config.TELEGRAM_LOG_PEER_ID
+                ), notification=True)
+                await asyncio.sleep(5)
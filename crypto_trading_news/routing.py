@@ -0,0 +1,102 @@
+import re
+import json
+
+def is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+# default trade chat keywords, matched as whole words ("sl" no longer matches "slow")
+DEFAULT_TRADE_KEYWORDS = ["short", "long", "buy", "sell", "leverage", "sl"]
+
+class RoutingRule:
+    """
+    Send the messages of some sources to chat_ids.
+    sources: "*", a platform ("telegram") or one feed ("telegram:channel", "twitter:user", "discord:channel_id", "threads:user").
+    keywords: whole words or phrases, case-insensitive, at least one must appear; empty matches every message of the sources.
+    """
+    def __init__(self, chat_ids: list[int], sources: list[str] | None = None, keywords: list[str] | None = None):
+        self.chat_ids = [int(chat_id) for chat_id in chat_ids]
+        self.sources = [source.lower() for source in (sources or ["*"])]
+        self.keywords = frozenset(" ".join(keyword.lower().split()) for keyword in (keywords or []))
+
+    def applies_to(self, sources: tuple[str, ...]) -> bool:
+        for pattern in self.sources:
+            for source in sources:
+                if pattern == "*" or source == pattern or source.startswith(pattern + ":"):
+                    return True
+        return False
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RoutingRule":
+        return cls(data["chat_ids"], data.get("sources"), data.get("keywords"))
+
+class Router:
+    """
+    Picks the target chats of a message. The keywords of all rules are compiled into one regex, a single pass
+    over the text finds every keyword present, then each rule of the message's sources is a set intersection.
+    The regex only reports the longest keyword at a position, the shorter keywords it starts with ("stop" in
+    "stop loss") are derived from it, and the scan resumes inside the match for those starting later ("loss").
+    Messages matching no rule go to default_chat_ids.
+    """
+    def __init__(self, rules: list[RoutingRule], default_chat_ids: list[int]):
+        self.rules = rules
+        self.default_chat_ids = default_chat_ids
+        keywords = sorted({keyword for rule in rules for keyword in rule.keywords}, key=len, reverse=True)
+        # longest first so "stop loss" wins over "stop"; inner spaces match any whitespace.
+        # No leading \b: a pattern starting with plain literals lets re skip ahead to their first letters,
+        # the word boundary before a match is checked in iter_keywords
+        alternation = "|".join(r"\s+".join(map(re.escape, keyword.split())) for keyword in keywords)
+        self.pattern = re.compile(rf"(?:{alternation})\b") if keywords else None
+        # keyword -> the shorter keywords it starts with, ending on a word boundary
+        self.map_prefixes = {keyword: [
+            prefix for prefix in keywords
+            if len(prefix) < len(keyword) and keyword.startswith(prefix)
+            and is_word_char(keyword[len(prefix) - 1]) != is_word_char(keyword[len(prefix)])
+        ] for keyword in keywords}
+        self.map_rules_by_sources: dict[tuple[str, ...], list[RoutingRule]] = {}
+
+    def rules_for(self, sources: tuple[str, ...]) -> list[RoutingRule]:
+        if sources not in self.map_rules_by_sources:
+            lower_sources = tuple(source.lower() for source in sources)
+            self.map_rules_by_sources[sources] = [rule for rule in self.rules if rule.applies_to(lower_sources)]
+        return self.map_rules_by_sources[sources]
+
+    def iter_keywords(self, text: str | None):
+        """Keywords present in the text as whole words, in order of appearance, overlapping ones included"""
+        if self.pattern is None or not text:
+            return
+        text = text.lower()
+        position = 0
+        while match := self.pattern.search(text, position):
+            start = match.start()
+            # a keyword may still start later in the match: inside a word ("belong") or overlapping ("stop loss")
+            position = start + 1
+            if start > 0 and is_word_char(text[start - 1]):
+                continue
+            keyword = " ".join(match.group().split())
+            yield keyword
+            yield from self.map_prefixes[keyword]
+
+    def route(self, text: str | None, *sources: str) -> list[int]:
+        """Target chats of a message, sources are the names of its feed (ex: "telegram:123", "telegram:username")"""
+        rules = self.rules_for(sources)
+        # rules still waiting for one of their keywords, the scan stops as soon as none is left
+        pending = {index for index, rule in enumerate(rules) if rule.keywords}
+        if pending:
+            for keyword in self.iter_keywords(text):
+                pending = {index for index in pending if keyword not in rules[index].keywords}
+                if not pending:
+                    break
+        chat_ids = []
+        for index, rule in enumerate(rules):
+            if index not in pending:
+                chat_ids += [chat_id for chat_id in rule.chat_ids if chat_id not in chat_ids]
+        return chat_ids or list(self.default_chat_ids)
+
+def parse_rules(value: str, trade_chat_id: int) -> list[RoutingRule]:
+    """
+    ROUTING_RULES: JSON list of {"chat_ids": [...], "sources": [...], "keywords": [...]}.
+    Empty: the trade keywords of telegram, discord and threads posts go to the trade chat, as before.
+    """
+    if value.strip():
+        return [RoutingRule.from_dict(rule) for rule in json.loads(value)]
+    return [RoutingRule([trade_chat_id], ["telegram", "discord", "threads"], DEFAULT_TRADE_KEYWORDS)]
@@ -4,24 +4,36 @@ from .config import Config
 from .threads import Threads
 from .telegram import Telegram
 from .discord import Discord
-from .notification import NotificationHandler
+from .notification import NotificationHandler, Message
 import asyncio
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
-from .binance_api import BinanceAPI
+from .binance_api import AsyncBinanceAPI
 from .command import Command
+from .state import StateStore
+from .routing import Router, parse_rules
 
-async def run_all(logger: Logger, config: Config, threads: Threads, twitter: Twitter, telegram: Telegram, discord: Discord, notification: NotificationHandler, command: Command):
+async def run_all(logger: Logger, config: Config, threads: Threads, twitter: Twitter, telegram: Telegram, discord: Discord, notification: NotificationHandler, binance_api: AsyncBinanceAPI, command: Command, state: StateStore):
+    await binance_api.connect()
+    await discord.init()
+    notification.add_enricher(command.f_enrich_signal)
     scheduler = AsyncIOScheduler(logger=logger)
     # if config.THREADS_ENABLED:
     #     for username in config.THREADS_LIST_USERNAME:
     #         scheduler.add_job(threads.retrieve_user_posts, 'interval', seconds=config.THREADS_SCRAPE_SLEEP_TIME, id=f"threads-{username}", args=[username])
     scheduler.add_job(threads.scrape_user_posts, 'interval', seconds=config.THREADS_SCRAPE_SLEEP_TIME, id="threads")
     scheduler.add_job(twitter.scrape_user_tweets, 'interval', seconds=config.TWITTER_SCRAPE_SLEEP_TIME, id="twitter")
-    scheduler.add_job(telegram.scrape_channel_messages, 'interval', seconds=config.TELEGRAM_SCRAPE_SLEEP_TIME, id="telegram")
+    scheduler.add_job(telegram.scrape_channel_messages, 'interval', seconds=telegram.poll_interval, id="telegram")
     scheduler.add_job(discord.scrape_channel_messages, 'interval', seconds=config.DISCORD_SCRAPE_SLEEP_TIME, id="discord")
     scheduler.start()
 
+    def on_flush_error(err: Exception):
+        logger.error(Message(
+            title="Error StateStore.flush",
+            body=f"Error: {err=}\nThe batch is kept for the next flush",
+            chat_id=config.TELEGRAM_LOG_PEER_ID
+        ), notification=True)
+
     application_builder = Application.builder().token(config.TELEGRAM_BOT_TRADING_TOKEN).read_timeout(7).get_updates_read_timeout(42)
     if config.TELEGRAM_PROXY.python_telegram_bot_proxy:
         application_builder = application_builder.proxy(config.TELEGRAM_PROXY.python_telegram_bot_proxy).get_updates_proxy(config.TELEGRAM_PROXY.python_telegram_bot_proxy)
@@ -42,6 +54,7 @@ async def run_all(logger: Logger, config: Config, threads: Threads, twitter: Twi
     application.add_handler(CommandHandler("freplies_track", command.freplies_track))
     application.add_handler(CommandHandler("freplies_list", command.freplies_list))
     application.add_handler(CommandHandler("freplies_remove", command.freplies_remove))
+    application.add_handler(CommandHandler("fhealth", command.fhealth))
     application.add_handler(MessageHandler(~filters.COMMAND, command.info_message))
     application.add_error_handler(command.error)
 
@@ -54,22 +67,39 @@ async def run_all(logger: Logger, config: Config, threads: Threads, twitter: Twi
             application.updater.start_polling(),
             notification.process_queue(),
             telegram.cleanup_map_latest_text(),
+            telegram.watch_connection(),
+            state.run_flush(on_flush_error),
         )
 
         await application.updater.stop()
         await application.stop()
     scheduler.shutdown()
+    await binance_api.close()
+    command.chart.close()
+    command.account_mirror.stop()
+    await threads.close()
+    await discord.close()
+    await notification.close()
 
 def main():
     config = Config()
-    notification = NotificationHandler(config)
+    state = StateStore(config.STATE_DB_PATH, config.STATE_FLUSH_INTERVAL)
+
+    notification = NotificationHandler(config, state=state)
     logger = Logger(config, notification, "news_trade_server")
 
-    twitter = Twitter(config, logger)
-    threads = Threads(config, logger)
-    telegram = Telegram(config, logger)
-    discord = Discord(config, logger)
-    binanceAPI = BinanceAPI(config, logger)
-    command = Command(config, logger, binance_api=binanceAPI, threads=threads)
+    # compiled once, shared by every source
+    router = Router(parse_rules(config.ROUTING_RULES, config.TELEGRAM_TRADE_PEER_ID), [config.TELEGRAM_NEWS_PEER_ID])
+
+    twitter = Twitter(config, logger, state, router)
+    threads = Threads(config, logger, state, router)
+    telegram = Telegram(config, logger, state, router)
+    discord = Discord(config, logger, state, router)
+    binanceAPI = AsyncBinanceAPI(config, logger)
+    command = Command(config, logger, binance_api=binanceAPI, threads=threads, state=state)
 
-    asyncio.run(run_all(logger=logger, config=config, threads=threads, twitter=twitter, telegram=telegram, discord=discord, notification=notification, command=command))
+    try:
+        asyncio.run(run_all(logger=logger, config=config, threads=threads, twitter=twitter, telegram=telegram, discord=discord, notification=notification, binance_api=binanceAPI, command=command, state=state))
+    finally:
+        # last write-behind batch
+        state.close()
@@ -0,0 +1,96 @@
+import os
+import json
+import sqlite3
+import asyncio
+import threading
+from typing import Any, Callable, Iterable
+
+class StateStore:
+    """
+    Embedded SQLite (WAL) store for watermarks and tracked state, so a restart resumes where it stopped.
+    set/delete/clear only touch an in-memory pending map, flush writes the whole batch in one transaction,
+    so hot paths never pay an fsync.
+    """
+    def __init__(self, path: str, flush_interval: float = 5):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flushes = 0
+        self.writes = 0
+        self.failures = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS state (namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (namespace, key)) WITHOUT ROWID")
+        self._pending: dict[tuple[str, str], str | None] = {} # None means delete
+        self._cleared: set[str] = set()
+        self._pending_mutex = threading.Lock()
+        self._conn_mutex = threading.Lock()
+
+    def load(self, namespace: str) -> dict[str, Any]:
+        """Bulk read of one namespace, keys come back as str"""
+        with self._conn_mutex:
+            rows = self._conn.execute("SELECT key, value FROM state WHERE namespace = ?", (namespace,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def set(self, namespace: str, key, value: Any):
+        with self._pending_mutex:
+            self._pending[(namespace, str(key))] = json.dumps(value)
+
+    def delete(self, namespace: str, key):
+        with self._pending_mutex:
+            self._pending[(namespace, str(key))] = None
+
+    def clear(self, namespace: str):
+        with self._pending_mutex:
+            self._pending = {k: v for k, v in self._pending.items() if k[0] != namespace}
+            self._cleared.add(namespace)
+
+    def flush(self):
+        with self._pending_mutex:
+            pending, self._pending = self._pending, {}
+            cleared, self._cleared = self._cleared, set()
+        if not pending and not cleared:
+            return
+        upserts = [(namespace, key, value) for (namespace, key), value in pending.items() if value is not None]
+        deletes = [(namespace, key) for (namespace, key), value in pending.items() if value is None]
+        with self._conn_mutex:
+            try:
+                self._conn.execute("BEGIN")
+                # clears were queued before any pending write of the same namespace
+                self._conn.executemany("DELETE FROM state WHERE namespace = ?", [(namespace,) for namespace in cleared])
+                self._conn.executemany("INSERT INTO state (namespace, key, value) VALUES (?, ?, ?) ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value", upserts)
+                self._conn.executemany("DELETE FROM state WHERE namespace = ? AND key = ?", deletes)
+                self._conn.execute("COMMIT")
+            except Exception:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                self.restore(pending, cleared)
+                raise
+        self.flushes += 1
+        self.writes += len(pending)
+
+    def restore(self, pending: dict[tuple[str, str], str | None], cleared: Iterable[str]):
+        """Put a failed batch back for the next flush, what was queued since is newer and wins"""
+        with self._pending_mutex:
+            # a namespace cleared since supersedes the failed writes of that namespace
+            pending = {k: v for k, v in pending.items() if k[0] not in self._cleared}
+            self._pending = {**pending, **self._pending}
+            self._cleared.update(cleared)
+        self.failures += 1
+
+    async def run_flush(self, on_error: Callable[[Exception], None]):
+        """Write-behind loop, the batch is written off the event loop, a failed batch is retried on the next run"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as err:
+                on_error(err)
+
+    def close(self):
+        self.flush()
+        with self._conn_mutex:
+            self._conn.close()
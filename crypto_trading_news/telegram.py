@@ -1,22 +1,45 @@
 from .logger import Logger
 from .config import Config
 from .notification import Message
-from telethon import TelegramClient, types
+from telethon import TelegramClient, types, events
 from telethon.sessions import StringSession
 from datetime import datetime, timedelta, timezone
 import asyncio
 import pytz
-from .util import is_command_trade
+from .util import DigestCache
+from .state import StateStore
+from .routing import Router
 class Telegram:
     TTL_SECONDS = 3600  # for example: 1 hour TTL for cache
 
-    def __init__(self, config: Config, logger: Logger):
+    def __init__(self, config: Config, logger: Logger, state: StateStore, router: Router):
         self.config = config
         self.logger = logger
+        self.state = state
+        self.router = router
         self.client = TelegramClient(StringSession(config.TELEGRAM_SESSION_STRING), config.TELEGRAM_API_ID, config.TELEGRAM_API_HASH, proxy=config.TELEGRAM_PROXY.telethon_proxy)
         self.channels = []
-        self.map_latest_text = {}
+        self.map_channel = {}
+        self.map_latest_text = DigestCache(self.TTL_SECONDS)
         self.map_offset_date = {}
+        self.pushed = 0
+        self.gap_filled = 0
+
+    @property
+    def poll_interval(self) -> int:
+        """In push mode polling only fills the gaps left by disconnects, so it runs rarely"""
+        if self.config.TELEGRAM_PUSH_ENABLED:
+            return self.config.TELEGRAM_GAP_FILL_SLEEP_TIME
+        return self.config.TELEGRAM_SCRAPE_SLEEP_TIME
+
+    def advance_offset_date(self, channel: types.Channel, message: types.Message):
+        """Only the polling path advances the watermark, a pushed post says nothing about the ones missed before it"""
+        date = message.date
+        if message.edit_date is not None:
+            date = message.edit_date
+        if date > self.map_offset_date[channel.id]:
+            self.map_offset_date[channel.id] = date
+            self.state.set("telegram_offset_date", channel.id, date.isoformat())
 
     async def pull_messages(self, channel: types.Channel):
         async def get_messages():
@@ -31,12 +54,9 @@ class Telegram:
             messages = await get_messages()
             if len(messages) > 0:
                 for message in messages:
-                    date = message.date
-                    if message.edit_date is not None:
-                        date = message.edit_date
-                    if date > self.map_offset_date[channel.id]:
-                        self.map_offset_date[channel.id] = date
+                    self.advance_offset_date(channel, message)
                     await self.handle_message(channel, message)
+                self.gap_filled += len(messages)
         except Exception as err:
             self.logger.error(Message(
                 title=f"Error Telegram.pull_messages - {channel.title} - {channel.id}",
@@ -48,51 +68,108 @@ class Telegram:
     
     async def connect(self):
         await self.client.start()
+        map_stored_offset_date = self.state.load("telegram_offset_date")
         for channel in self.config.TELEGRAM_LIST_CHANNEL:
             if channel[0] != '@':
                 channel_v = await self.client.get_entity(types.PeerChannel(int(channel)))
             else:
                 channel_v = await self.client.get_entity(channel)
             self.channels.append(channel_v)
+            # resume from the stored watermark, but never replay more than the SLA window
             self.map_offset_date[channel_v.id] = datetime.now(tz=timezone.utc) - timedelta(seconds = self.config.TELEGRAM_SLA)
+            if str(channel_v.id) in map_stored_offset_date:
+                self.map_offset_date[channel_v.id] = max(self.map_offset_date[channel_v.id], datetime.fromisoformat(map_stored_offset_date[str(channel_v.id)]))
+            self.map_channel[channel_v.id] = channel_v
+        if self.config.TELEGRAM_ENABLED and self.config.TELEGRAM_PUSH_ENABLED and len(self.channels) > 0:
+            self.client.add_event_handler(self.on_message, events.NewMessage(chats=self.channels))
+            self.client.add_event_handler(self.on_message, events.MessageEdited(chats=self.channels))
+            # catch up from the stored watermark, the scheduler only runs the gap-filler every poll_interval
+            await self.scrape_channel_messages()
+
+    async def on_message(self, event: events.NewMessage.Event | events.MessageEdited.Event):
+        """Push path, Telethon calls it for every new or edited post of the tracked channels"""
+        message = event.message
+        channel = self.map_channel.get(getattr(message.peer_id, "channel_id", None))
+        if channel is None:
+            return
+        self.pushed += 1
+        # no watermark here: the gap-filler resumes from the last polled post, map_latest_text skips what was pushed
+        await self.handle_message(channel, message)
+
+    async def watch_connection(self):
+        """
+        Updates are lost while Telethon reconnects, fill the gap as soon as the connection is back.
+        A drop shorter than the check interval isn't seen here, the gap-filler still gets its posts on its next run
+        since only polling advances the watermark.
+        """
+        if not (self.config.TELEGRAM_ENABLED and self.config.TELEGRAM_PUSH_ENABLED):
+            return
+        connected = True
+        while True:
+            await asyncio.sleep(1)
+            if not self.client.is_connected():
+                connected = False
+                continue
+            if not connected:
+                self.logger.info(Message(f"Telegram reconnected, filling the gap of {len(self.channels)} channels"))
+                await self.scrape_channel_messages()
+            connected = True
 
     async def cleanup_map_latest_text(self):
-        """Periodically clean up old entries from map_latest_text"""
+        """Periodically advance the expiry wheel of map_latest_text, so idle periods release memory too"""
+        evictions = 0
         while True:
             try:
-                now = datetime.now(tz=timezone.utc)
-                expired_keys = [
-                    k for k, (_, ts) in self.map_latest_text.items()
-                    if (now - ts).total_seconds() > self.TTL_SECONDS
-                ]
-                for k in expired_keys:
-                    del self.map_latest_text[k]
-                if expired_keys:
-                    self.logger.info(f"Cleaned {len(expired_keys)} expired Telegram cache entries")
+                self.map_latest_text.advance()
+                stats = self.map_latest_text.stats()
+                if stats["evictions"] > evictions:
+                    self.logger.info(f"Cleaned {stats['evictions'] - evictions} expired Telegram cache entries, stats: {stats}")
+                    evictions = stats["evictions"]
             except Exception as err:
                 self.logger.error(Message(
                     title="Error cleaning map_latest_text",
                     body=f"Error: {err}",
                     chat_id=self.config.TELEGRAM_LOG_PEER_ID
                 ))
-            await asyncio.sleep(300)  # cleanup every 5 minutes
+            await asyncio.sleep(self.map_latest_text.resolution)
+
+    async def deliver(self, channel: types.Channel, message: types.Message, payload: Message):
+        """Forward the post to payload.chat_id, or send payload as text when the channel forbids forwarding"""
+        target = payload.chat_id
+        # Try to forward directly
+        if not channel.noforwards:
+            # forwarding bypasses the notification queue, so check the cross-source dedup here
+            if self.logger.NotificationHandler.is_duplicate(payload):
+                return
+            try:
+                await self.client.forward_messages(target, message)
+                # the forward can't be edited, the signal's /forder follows it
+                if self.logger.NotificationHandler.can_enrich(payload):
+                    lines = await self.logger.NotificationHandler.enrich(payload)
+                    if lines:
+                        self.logger.info(Message(title=f"Signal - {channel.title}", body="\n".join(lines), chat_id=target), notification=True)
+            except Exception as err:
+                self.logger.error(Message(
+                    title=f"Error forwarding message - {channel.title}",
+                    body=f"Error: {err}",
+                    chat_id=self.config.TELEGRAM_LOG_PEER_ID
+                ))
+                # fallback: send plain text
+                self.logger.info(payload, notification=True)
+        else:
+            # channel.noforwards = True
+            self.logger.info(payload, notification=True)
 
     async def handle_message(self, channel: types.Channel, message: types.Message):
         """Handles forwarding or logging of a single message."""
         try:
             body = message.message or ""
             # No handle message same as previous
-            key = f"{channel.id}_{message.id}"
-            now = datetime.now(tz=timezone.utc)
+            key = channel.id << 32 | message.id
 
-            # Skip if same as last text
-            if key in self.map_latest_text:
-                last_text, _ = self.map_latest_text[key]
-                if last_text == body:
-                    return
-
-            # Update cache with new text + timestamp
-            self.map_latest_text[key] = (body, now)
+            # Skip if same as last text, otherwise remember its digest
+            if self.map_latest_text.seen(key, body):
+                return
 
             url = f"https://t.me/{channel.id}/{message.id}"
             if channel.username:
@@ -100,27 +177,9 @@ class Telegram:
             body += f"\n\n**[Link: {url}]({url})**"
             title = f"Telegram - {channel.title} - Time: {message.date.astimezone(pytz.timezone(self.config.TIMEZONE))}"
 
-            # Split logic: trade vs news
-            if is_command_trade(body):
-                target = self.config.TELEGRAM_TRADE_PEER_ID
-            else:
-                target = self.config.TELEGRAM_NEWS_PEER_ID
-
-            # Try to forward directly
-            if not channel.noforwards:
-                try:
-                    await self.client.forward_messages(target, message)
-                except Exception as err:
-                    self.logger.error(Message(
-                        title=f"Error forwarding message - {channel.title}",
-                        body=f"Error: {err}",
-                        chat_id=self.config.TELEGRAM_LOG_PEER_ID
-                    ))
-                    # fallback: send plain text
-                    self.logger.info(Message(title=title, body=body, chat_id=target), notification=True)
-            else:
-                # channel.noforwards = True
-                self.logger.info(Message(title=title, body=body, chat_id=target), notification=True)
+            # Split logic: trade vs news, the link appended above isn't part of the post
+            for target in self.router.route(message.message, f"telegram:{channel.id}", f"telegram:{channel.username}"):
+                await self.deliver(channel, message, Message(title=title, body=body, chat_id=target, source=f"telegram:{channel.id}"))
 
         except Exception as err:
             self.logger.error(Message(
@@ -9,19 +9,178 @@ from .notification import Message
 from datetime import datetime
 import pytz
 import re
-from .util import is_command_trade
-from playwright.async_api import async_playwright, Browser
+from .state import StateStore
+from .routing import Router
+from playwright.async_api import async_playwright, Browser, Page, Playwright
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from html.parser import HTMLParser
+from aiohttp_socks import ProxyConnector
+import aiohttp
 import asyncio
+import codecs
+import json
+
+class BrowserPool:
+    """
+    One long-lived Chromium shared by every scrape, each scrape gets its own context and page.
+    The browser is relaunched when it disconnects or after max_uses pages, a retired browser is closed once its last page is done.
+    """
+    def __init__(self, max_concurrency: int = 4, max_uses: int = 200):
+        self.max_uses = max_uses
+        self.launches = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._lock = asyncio.Lock()
+        self._playwright: Playwright | None = None
+        self._browser: Browser | None = None
+        self._uses = 0
+        self._active: dict[Browser, int] = {}
+
+    async def _acquire(self) -> Browser:
+        async with self._lock:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            if self._browser is not None and (not self._browser.is_connected() or self._uses >= self.max_uses):
+                await self._retire(self._browser)
+            if self._browser is None:
+                self._browser = await self._playwright.chromium.launch(headless=True, chromium_sandbox=False)
+                self._uses = 0
+                self.launches += 1
+            self._uses += 1
+            self._active[self._browser] = self._active.get(self._browser, 0) + 1
+            return self._browser
+
+    async def _release(self, browser: Browser):
+        self._active[browser] -= 1
+        if browser is not self._browser and self._active[browser] == 0:
+            await self._close_browser(browser)
+
+    async def _retire(self, browser: Browser):
+        self._browser = None
+        if self._active.get(browser, 0) == 0:
+            await self._close_browser(browser)
+
+    async def _close_browser(self, browser: Browser):
+        self._active.pop(browser, None)
+        try:
+            await browser.close()
+        except Exception:
+            pass # already crashed
+
+    @asynccontextmanager
+    async def page(self, **context_options) -> AsyncIterator[Page]:
+        async with self._semaphore:
+            browser = await self._acquire()
+            context = None
+            try:
+                context = await browser.new_context(**context_options)
+                yield await context.new_page()
+            finally:
+                if context:
+                    try:
+                        await context.close()
+                    except Exception:
+                        pass
+                await self._release(browser)
+
+    async def close(self):
+        async with self._lock:
+            for browser in list(self._active) + ([self._browser] if self._browser else []):
+                await self._close_browser(browser)
+            self._browser = None
+            if self._playwright:
+                await self._playwright.stop()
+                self._playwright = None
+
+class ScheduledServerJSParser(HTMLParser):
+    """
+    Streaming parser for the `script[type="application/json"][data-sjs]` blobs of a Threads page,
+    fed chunk by chunk so the page is never held as one string. Produces the same items as the in-browser extraction.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.hidden_datasets = []
+        self._chunks: list[str] | None = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "script":
+            return
+        attrs = dict(attrs)
+        if attrs.get("type") == "application/json" and "data-sjs" in attrs:
+            self._chunks = []
+
+    def handle_data(self, data):
+        if self._chunks is not None:
+            self._chunks.append(data)
+
+    def handle_endtag(self, tag):
+        if tag != "script" or self._chunks is None:
+            return
+        txt = "".join(self._chunks)
+        self._chunks = None
+        if '"ScheduledServerJS"' not in txt:
+            return
+        is_profile = "follower_count" in txt
+        is_threads = "thread_items" in txt
+        if not is_profile and not is_threads:
+            return
+        try:
+            self.hidden_datasets.append({"data": json.loads(txt), "isProfile": is_profile, "isThreads": is_threads})
+        except ValueError:
+            pass
+
+class ThreadsHttpClient:
+    """Pooled keep-alive sessions for fetching Threads pages without a browser, one session per proxy port"""
+    HEADERS = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.9",
+        "Sec-Fetch-Mode": "navigate",
+    }
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, config: Config):
+        self.config = config
+        self._sessions: dict[str | None, aiohttp.ClientSession] = {}
+
+    def _session(self) -> aiohttp.ClientSession:
+        proxy = self.config.TOR_PROXY.aiohttp_proxy
+        if proxy not in self._sessions:
+            limit = self.config.THREADS_MAX_CONCURRENCY
+            connector = ProxyConnector.from_url(proxy, limit=limit) if proxy else aiohttp.TCPConnector(limit=limit)
+            self._sessions[proxy] = aiohttp.ClientSession(connector=connector, headers=self.HEADERS, timeout=aiohttp.ClientTimeout(total=10))
+        return self._sessions[proxy]
+
+    async def fetch_hidden_datasets(self, url: str) -> list[dict]:
+        parser = ScheduledServerJSParser()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        async with self._session().get(url) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.content.iter_chunked(self.CHUNK_SIZE):
+                parser.feed(decoder.decode(chunk))
+        parser.feed(decoder.decode(b"", final=True))
+        parser.close()
+        return parser.hidden_datasets
+
+    async def close(self):
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
 
 class Threads:
     """
     A basic interface for interacting with Threads.
     """
     BASE_URL = "https://www.threads.com"
-    def __init__(self, config: Config, logger: Logger):
+    def __init__(self, config: Config, logger: Logger, state: StateStore, router: Router):
         self.config = config
         self.logger = logger
-        self.map_last_timestamp = {}
+        self.state = state
+        self.router = router
+        self.map_last_timestamp = state.load("threads_last_timestamp")
+        self.browser_pool = BrowserPool(config.THREADS_MAX_CONCURRENCY, config.THREADS_BROWSER_MAX_USES)
+        self.http_client = ThreadsHttpClient(config)
+        self.http_fallbacks = 0
 
     # Note: we'll also be using parse_thread function we wrote earlier:
 
@@ -76,51 +235,71 @@ class Threads:
 
 
 
-    async def scrape_thread(self, url: str, browser: Browser, is_posts = False) -> dict:
+    def parse_hidden_datasets(self, hidden_datasets: list[dict], url: str, is_posts = False) -> dict:
+        parsed = {
+            "user": {},
+            "threads": [],
+        }
+        url_clean = url.removesuffix("?sort_order=recent")
+        for item in hidden_datasets:
+            if item['isProfile']:
+                user_data = nested_lookup('user', item['data'])
+                if user_data:
+                    parsed['user'] = self.parse_profile(user_data[0])
+            if item['isThreads']:
+                thread_items = nested_lookup('thread_items', item['data'])
+                parse_thread_items = [self.parse_thread(t) for thread in thread_items for t in thread]
+                if len(parse_thread_items) > 0 and is_posts and parse_thread_items[0]["url"] != url_clean:
+                    continue
+                parsed['threads'].extend(parse_thread_items)
+        return parsed
+
+    async def scrape_thread(self, url: str, is_posts = False) -> dict:
         """Scrape Threads their recent posts and there profile if exists from a given URL"""
+        if self.config.THREADS_FETCH_MODE == "http":
+            parsed = await self.scrape_thread_http(url, is_posts)
+            if len(parsed['threads']) > 0:
+                return parsed
+            # server rendered page had no thread_items (login wall, layout change, ...), render it instead
+            self.http_fallbacks += 1
+        return await self.scrape_thread_browser(url, is_posts)
+
+    async def scrape_thread_http(self, url: str, is_posts = False) -> dict:
+        try:
+            hidden_datasets = await self.http_client.fetch_hidden_datasets(url)
+            return self.parse_hidden_datasets(hidden_datasets, url, is_posts)
+        except Exception:
+            return {"user": {}, "threads": []}
+
+    async def scrape_thread_browser(self, url: str, is_posts = False) -> dict:
         parsed = {
             "user": {},
             "threads": [],
         }
-        page = None
-        context = None
         try:
-            context = await browser.new_context(viewport={"width": 1920, "height": 1080}, proxy=self.config.TOR_PROXY.playwright_proxy)
-            page = await context.new_page()
-
-            await page.goto(url, wait_until="domcontentloaded", timeout=6000)
-            # wait for page to finish loading
-            await page.wait_for_selector("[data-pressable-container=true]", timeout=6000)
-            
-            url_clean = url.removesuffix("?sort_order=recent")
-            # Extract all JSON blobs directly in the browser
-            hidden_datasets = await page.evaluate('''() => {
-                const scripts = document.querySelectorAll('script[type="application/json"][data-sjs]');
-                const parsed = [];
-                for (const el of scripts) {
-                    const txt = el.textContent;
-                    if (!txt.includes('"ScheduledServerJS"')) continue;
-                    const isProfile = txt.includes('follower_count');
-                    const isThreads = txt.includes('thread_items');
-                    if (!isProfile && !isThreads) continue;
-                    try {
-                        parsed.push({ data: JSON.parse(txt), isProfile, isThreads });
-                    } catch {}
-                }
-                return parsed;
-            }''')
-            for item in hidden_datasets:
-                if item['isProfile']:
-                    user_data = nested_lookup('user', item['data'])
-                    if user_data:
-                        parsed['user'] = self.parse_profile(user_data[0])
-                if item['isThreads']:
-                    thread_items = nested_lookup('thread_items', item['data'])
-                    parse_thread_items = [self.parse_thread(t) for thread in thread_items for t in thread]
-                    if len(parse_thread_items) > 0 and is_posts and parse_thread_items[0]["url"] != url_clean:
-                        continue
-                    parsed['threads'].extend(parse_thread_items)
-                        
+            async with self.browser_pool.page(viewport={"width": 1920, "height": 1080}, proxy=self.config.TOR_PROXY.playwright_proxy) as page:
+                await page.goto(url, wait_until="domcontentloaded", timeout=6000)
+                # wait for page to finish loading
+                await page.wait_for_selector("[data-pressable-container=true]", timeout=6000)
+
+                # Extract all JSON blobs directly in the browser
+                hidden_datasets = await page.evaluate('''() => {
+                    const scripts = document.querySelectorAll('script[type="application/json"][data-sjs]');
+                    const parsed = [];
+                    for (const el of scripts) {
+                        const txt = el.textContent;
+                        if (!txt.includes('"ScheduledServerJS"')) continue;
+                        const isProfile = txt.includes('follower_count');
+                        const isThreads = txt.includes('thread_items');
+                        if (!isProfile && !isThreads) continue;
+                        try {
+                            parsed.push({ data: JSON.parse(txt), isProfile, isThreads });
+                        } catch {}
+                    }
+                    return parsed;
+                }''')
+            # release the page before parsing
+            parsed = self.parse_hidden_datasets(hidden_datasets, url, is_posts)
         except Exception as err:
             pass
             # self.logger.error(Message(
@@ -128,16 +307,11 @@ class Threads:
             #     body=f"Error: {err=}", 
             #     chat_id=self.config.TELEGRAM_LOG_PEER_ID
             # ))
-        finally:
-            if page:
-                await page.close()
-            if context:
-                await context.close()
         return parsed
 
-    async def retrieve_user_posts(self, username: str, browser: Browser) -> list[Message]:
+    async def retrieve_user_posts(self, username: str) -> list[Message]:
         url = f'{self.BASE_URL}/@{username}'
-        response = await self.scrape_thread(url, browser)
+        response = await self.scrape_thread(url)
         time_now = int(time.time())
         max_timestamp = 0
         for thread in response['threads']:
@@ -154,31 +328,30 @@ class Threads:
             max_timestamp = max(max_timestamp, thread['published_on'])
             url = f"{thread['url']}?sort_order=recent"
             body=f"{thread['text']}\n[Link: {url}]({url})"
-            chat_id = self.config.TELEGRAM_NEWS_PEER_ID
-            if is_command_trade(thread['text']):
-                chat_id = self.config.TELEGRAM_TRADE_PEER_ID
-                body += f"\n\n`/freplies {url}`"
-            message = Message(
-                body = body,
-                title = f"Threads - {username} - Time: {datetime.fromtimestamp(thread['published_on'], tz=pytz.timezone(self.config.TIMEZONE))}",
-                image=thread['images'],
-                chat_id=chat_id
-            )
-            self.logger.info(message, notification=True)
+            for chat_id in self.router.route(thread['text'], f"threads:{username}"):
+                message = Message(
+                    body = body + (f"\n\n`/freplies {url}`" if chat_id == self.config.TELEGRAM_TRADE_PEER_ID else ""),
+                    title = f"Threads - {username} - Time: {datetime.fromtimestamp(thread['published_on'], tz=pytz.timezone(self.config.TIMEZONE))}",
+                    image=thread['images'],
+                    chat_id=chat_id,
+                    source=f"threads:{username}"
+                )
+                self.logger.info(message, notification=True)
         if max_timestamp > 0:
             self.map_last_timestamp[username] = max_timestamp
+            self.state.set("threads_last_timestamp", username, max_timestamp)
     
     async def scrape_user_posts(self):
         if self.config.THREADS_ENABLED == False:
             return
         list_username = self.config.THREADS_LIST_USERNAME
         # self.logger.info(Message(f"Threads.scrape_user_posts with list username: {', '.join(list_username)}"))
-        async with async_playwright() as pw:
-            # start Playwright browser
-            browser = await pw.chromium.launch(headless=True, chromium_sandbox=False)
-            await asyncio.gather(*(self.retrieve_user_posts(u, browser) for u in list_username))
-            await browser.close()
+        await asyncio.gather(*(self.retrieve_user_posts(u) for u in list_username))
 
         # for u in list_username:
         #     await self.retrieve_user_posts(u)
         #     await asyncio.sleep(randint(2, 5))
+
+    async def close(self):
+        await self.http_client.close()
+        await self.browser_pool.close()
@@ -0,0 +1,154 @@
+import re
+from typing import Callable
+
+RE_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+RE_THOUSANDS = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?")
+RE_SIDE_BUY = re.compile(r"\b(long|buy)\b")
+RE_SIDE_SELL = re.compile(r"\b(short|sell)\b")
+RE_LEVERAGE = re.compile(r"\b(?:leverage|lev|cross|isolated)\b\D{0,10}?(\d{1,3})\s*x?\b|\b(\d{1,3})\s*x\b")
+# "$BTC", "#BTC", "BTCUSDT", "BTC/USDT", "BTCUSDT.P"
+RE_TAGGED_SYMBOL = re.compile(r"[#$]([A-Za-z0-9]{2,15})\b|\b([A-Za-z0-9]{2,15})\s*/?\s*USDT(?:\.P)?\b", re.IGNORECASE)
+RE_UPPER_WORD = re.compile(r"\b([A-Z0-9]{2,15})\b")
+# label at the start of a line, the numbers after it are its values
+# "open" only with a separator, "Open interest 5,000,000" isn't an entry
+RE_ENTRY_LABEL = re.compile(r"^\W*(?:entry(?:\s*zone)?|entries|buy\s*zone|sell\s*zone|open(?=\s*[:=])|price)\d{0,2}\b\s*", re.IGNORECASE)
+RE_SL_LABEL = re.compile(r"^\W*(?:sl|stop\s*loss|stoploss|stop)\b\s*", re.IGNORECASE)
+# with its number, spaced or not: "TP2 160", "Take profit 1 61000"
+RE_TP_LABEL = re.compile(r"^\W*(?:tp|targets?|take\s*profits?)\d{0,2}\b\s*(?:\d{1,2}\s+(?=\d))?", re.IGNORECASE)
+# numbering and percents inside a level list, "TP: 1) 150 2) 160", "TP2 160", "150 (+10%)"
+RE_LIST_MARKER = re.compile(r"\b(?:tp|t|target)\s*\d{1,2}\b\s*[:=)\-.]?|(?<![\d.,])\d{1,2}\s*[).:](?=\s+\d)|\d+(?:[.,]\d+)?\s*%", re.IGNORECASE)
+# not coins, even when written in capitals
+NOT_SYMBOLS = {"LONG", "SHORT", "BUY", "SELL", "SL", "TP", "ENTRY", "STOP", "TARGET", "LEVERAGE", "CROSS", "ISOLATED", "USDT", "USD"}
+
+def parse_number(number: str) -> float:
+    # "60,000" and "60,000.5" group thousands, otherwise the comma is the decimal separator ("0,0123")
+    if RE_THOUSANDS.fullmatch(number):
+        return float(number.replace(",", ""))
+    return float(number.replace(",", "."))
+
+def parse_numbers(text: str) -> list[float]:
+    numbers = []
+    for number in RE_NUMBER.findall(text):
+        try:
+            numbers.append(parse_number(number))
+        except ValueError: # "1.2.3"
+            pass
+    return numbers
+
+def format_price(price: float, precision: int) -> str:
+    """Fixed point without trailing zeros, "1.23e-05" isn't a price Binance accepts"""
+    return f"{price:.{precision}f}".rstrip("0").rstrip(".") if precision > 0 else f"{price:.0f}"
+
+class TradeSignal:
+    def __init__(self, symbol: str, side: str, entry: tuple[float, float] | None, stop_loss: float | None, take_profits: list[float], leverage: int | None):
+        self.symbol = symbol
+        self.side = side # BUY/SELL
+        self.entry = entry # (low, high) of the entry zone, None for market
+        self.stop_loss = stop_loss
+        self.take_profits = take_profits
+        self.leverage = leverage
+
+    def __str__(self):
+        parts = [f"{self.side} {self.symbol}"]
+        parts.append("entry market" if self.entry is None else "entry " + "-".join(dict.fromkeys(f"{price:g}" for price in self.entry)))
+        if self.stop_loss is not None:
+            parts.append(f"sl {self.stop_loss:g}")
+        if self.take_profits:
+            parts.append("tp " + " / ".join(f"{take_profit:g}" for take_profit in self.take_profits))
+        return ", ".join(parts)
+
+    @property
+    def entry_price(self) -> float | None:
+        """Edge of the zone reached first: the top for a buy, the bottom for a sell"""
+        if self.entry is None:
+            return None
+        return self.entry[1] if self.side == "BUY" else self.entry[0]
+
+    def is_plausible(self, price: float, max_entry_deviation: float, max_level_deviation: float) -> bool:
+        """
+        Levels checked against the current price: the entry close to it, the stop-loss below (buy) or above (sell)
+        both the price and the entry, every take-profit on the other side, none further than max_level_deviation.
+        A misread level would otherwise trigger at once, a limit far from the market fills at once at market.
+        """
+        if price <= 0:
+            return False
+        reference = price if self.entry is None else self.entry_price
+        if abs(reference - price) / price > max_entry_deviation:
+            return False
+        low, high = (price, price) if self.entry is None else (min(price, self.entry[0]), max(price, self.entry[1]))
+        is_buy = self.side == "BUY"
+        if self.stop_loss is not None and (self.stop_loss >= low if is_buy else self.stop_loss <= high):
+            return False
+        if any(take_profit <= high if is_buy else take_profit >= low for take_profit in self.take_profits):
+            return False
+        levels = self.take_profits + ([self.stop_loss] if self.stop_loss is not None else [])
+        return all(abs(level - price) / price <= max_level_deviation for level in levels)
+
+    def forder_args(self, leverage: int, margin: float, price_precision: int) -> list[str]:
+        """Arguments of the matching /forder command, prices rounded to the symbol precision"""
+        optional = []
+        if self.entry is not None:
+            optional.append(format_price(self.entry_price, price_precision))
+        if self.stop_loss is not None:
+            optional.append(f"sl:{format_price(self.stop_loss, price_precision)}")
+        optional += [f"tp:{format_price(take_profit, price_precision)}" for take_profit in self.take_profits]
+        args = ["limit" if self.entry is not None else "market", self.side.lower(), self.symbol.removesuffix("USDT"), str(leverage), f"{margin:g}"]
+        if optional:
+            args.append("_".join(optional))
+        return args
+
+def find_symbol(text: str, is_symbol: Callable[[str], bool]) -> str | None:
+    """
+    First tradable tagged symbol ("$BTC", "#BTC", "BTCUSDT", "BTC/USDT"). Without tags a word in capitals is only
+    trusted when it is the single tradable one: "ONE more thing: buy BTC" names two coins and is ambiguous.
+    """
+    def tradable(candidates: list[str]) -> list[str]:
+        symbols = []
+        for candidate in candidates:
+            coin = candidate.upper().removesuffix("USDT")
+            if coin in NOT_SYMBOLS or coin.isdigit() or coin + "USDT" in symbols:
+                continue
+            if is_symbol(coin + "USDT"):
+                symbols.append(coin + "USDT")
+        return symbols
+    tagged = tradable([a or b for a, b in RE_TAGGED_SYMBOL.findall(text)])
+    if tagged:
+        return tagged[0]
+    untagged = tradable(RE_UPPER_WORD.findall(text))
+    return untagged[0] if len(untagged) == 1 else None
+
+def parse_signal(text: str | None, is_symbol: Callable[[str], bool]) -> TradeSignal | None:
+    """Trade signal of a post, None when it doesn't carry a tradable symbol, a side and a coherent stop-loss or entry"""
+    if not text:
+        return None
+    lower = text.lower()
+    is_buy, is_sell = RE_SIDE_BUY.search(lower) is not None, RE_SIDE_SELL.search(lower) is not None
+    if is_buy == is_sell:
+        return None
+    side = "BUY" if is_buy else "SELL"
+    symbol = find_symbol(text, is_symbol)
+    if symbol is None:
+        return None
+    entry, stop_loss, take_profits = None, None, []
+    for line in text.splitlines():
+        if (match := RE_SL_LABEL.match(line)) and stop_loss is None:
+            numbers = parse_numbers(line[match.end():])
+            stop_loss = numbers[0] if numbers else None
+        elif match := RE_TP_LABEL.match(line):
+            take_profits += parse_numbers(RE_LIST_MARKER.sub(" ", line[match.end():]))
+        elif (match := RE_ENTRY_LABEL.match(line)) and entry is None:
+            numbers = parse_numbers(line[match.end():])
+            if numbers:
+                entry = (min(numbers[:2]), max(numbers[:2]))
+    leverage = None
+    if match := RE_LEVERAGE.search(lower):
+        leverage = int(match.group(1) or match.group(2))
+    if stop_loss is None and entry is None:
+        return None
+    # a stop-loss on the wrong side of the entry means the post was misread
+    if stop_loss is not None and entry is not None:
+        if (side == "BUY" and stop_loss >= entry[0]) or (side == "SELL" and stop_loss <= entry[1]):
+            return None
+    if entry is not None and any(tp <= entry[1] if side == "BUY" else tp >= entry[0] for tp in take_profits):
+        return None
+    return TradeSignal(symbol, side, entry, stop_loss, take_profits, leverage)
@@ -7,18 +7,51 @@ from .notification import Message
 import time
 import pytz
 from datetime import datetime
-from random import randint
-from .util import is_command_trade
+from .util import TokenBucket
+from .state import StateStore
+from .routing import Router
+
+TWITTER_RATE_LIMIT_WINDOW = 900 # search quota is counted per 15 minutes
+
+class TwitterSession:
+    """One logged-in twikit client with its own request budget and rate-limit back-off"""
+    def __init__(self, index: int, cookies: dict, max_concurrency: int, budget: int):
+        self.index = index
+        self.client = Client(language='en-US')
+        self.client.set_cookies(cookies, clear_cookies=True)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.bucket = TokenBucket(budget / TWITTER_RATE_LIMIT_WINDOW, budget)
+        self.reset_at = 0 # epoch seconds from the x-rate-limit-reset of the last TooManyRequests
+
+    @property
+    def available(self) -> bool:
+        return time.time() >= self.reset_at
+
+class TwitterQuery:
+    """Schedule of one query, quiet queries run every `interval` cycles (doubling up to a max), active ones every cycle"""
+    def __init__(self, query: str):
+        self.query = query
+        self.interval = 1
+        self.next_cycle = 0
+
 class Twitter:
-    def __init__(self, config: Config, logger: Logger):
+    def __init__(self, config: Config, logger: Logger, state: StateStore, router: Router):
         self.config = config
         self.logger = logger
-        self.client = Client(language='en-US')
-        self.client.set_cookies(config.TWITTER_COOKIES_DICT, clear_cookies=True)
-        self.map_timestamp_by_user = {} 
+        self.state = state
+        self.router = router
+        self.sessions = [
+            TwitterSession(index, cookies, config.TWITTER_MAX_CONCURRENCY, config.TWITTER_SESSION_BUDGET)
+            for index, cookies in enumerate(config.TWITTER_COOKIES_LIST)
+        ]
+        self.queries = [TwitterQuery(query) for query in config.TWITTER_LIST_QUERY]
+        self.cycle = 0
+        self.map_timestamp_by_user = state.load("twitter_timestamp_by_user")
 
-    def filter_tweets(self, tweets: Result[Tweet]) -> list[Message]:
+    def filter_tweets(self, tweets: Result[Tweet]) -> int:
+        """Notify new tweets and return how many there were"""
         time_now = int(time.time())
+        count = 0
         update_max_timestamp = {}
         for tweet in tweets:
             tweet_timestamp = int(tweet.created_at_datetime.timestamp())
@@ -34,14 +67,12 @@ class Twitter:
                 update_max_timestamp[user_id] = max(update_max_timestamp[user_id], tweet_timestamp)
             else:
                 update_max_timestamp[user_id] = tweet_timestamp
-            chat_id = self.config.TELEGRAM_NEWS_PEER_ID
-            # TODO: Add logic force chat_id based on query
-            # if is_command_trade(tweet.full_text):
-            #     chat_id = self.config.TELEGRAM_TRADE_PEER_ID
+            chat_ids = self.router.route(tweet.full_text, f"twitter:{user_name}", f"twitter:{user_screen_name}")
             message = Message(
                 title= f"Twitter - {user_name} - Time: {datetime.fromtimestamp(tweet_timestamp, tz=pytz.timezone(self.config.TIMEZONE))}",
                 body= f"{tweet.full_text}\n\n[Link: {url}]({url})",
-                chat_id=chat_id
+                chat_id=chat_ids[0],
+                source=f"twitter:{user_name}"
             )
             if len(tweet.media) > 0:
                 images = []
@@ -51,27 +82,55 @@ class Twitter:
                     message.images = images
                 else:
                     message.image = images[0]
-            self.logger.info(message, notification=True)
+            for chat_id in chat_ids:
+                self.logger.info(message.copy_to(chat_id), notification=True)
+            count += 1
         for user_id in update_max_timestamp:
             self.map_timestamp_by_user[user_id] = update_max_timestamp[user_id]        
+            self.state.set("twitter_timestamp_by_user", user_id, update_max_timestamp[user_id])
+        return count
 
-    async def get_tweets(self, query: str) -> list[Message]:
+    async def get_tweets(self, twitter_query: TwitterQuery, session: TwitterSession):
+        query = twitter_query.query
         try:
-            tweets = await self.client.search_tweet(query, product='Latest', count=self.config.TWITTER_TWEETS_COUNT)
-            self.filter_tweets(tweets)
+            async with session.semaphore:
+                tweets = await session.client.search_tweet(query, product='Latest', count=self.config.TWITTER_TWEETS_COUNT)
+            if self.filter_tweets(tweets) > 0:
+                twitter_query.interval = 1
+            else:
+                twitter_query.interval = min(twitter_query.interval * 2, self.config.TWITTER_MAX_QUERY_INTERVAL)
+            twitter_query.next_cycle = self.cycle + twitter_query.interval
+        except TooManyRequests as err:
+            # only this session backs off, the query stays due for the next cycle
+            session.reset_at = err.rate_limit_reset or int(time.time()) + TWITTER_RATE_LIMIT_WINDOW
+            self.logger.warning(Message(f"Twitter session {session.index} rate limited until {datetime.fromtimestamp(session.reset_at, tz=pytz.timezone(self.config.TIMEZONE))}, query: {query}"))
         except Exception as err:
             self.logger.error(Message(
                 title=f"Error Twitter.get_tweets - {query}",
                 body=f"Error: {err=}", 
                 chat_id=self.config.TELEGRAM_LOG_PEER_ID
             ), notification=True)
+
+    def pick_session(self, start: int) -> TwitterSession | None:
+        """First available session with budget left, starting from `start` to spread queries"""
+        for offset in range(len(self.sessions)):
+            session = self.sessions[(start + offset) % len(self.sessions)]
+            if session.available and session.bucket.try_acquire():
+                return session
+        return None
     
     async def scrape_user_tweets(self):
         if self.config.TWITTER_ENABLED == False:
             return
-        list_query = self.config.TWITTER_LIST_QUERY
-        self.logger.info(Message(f"Twitter.scrape_user_tweets with list query: {', '.join(list_query)}"))
-        for query in list_query:
-            await self.get_tweets(query)
-            await asyncio.sleep(randint(5, 10))
+        self.cycle += 1
+        # recently active queries first so they get the budget when it runs low
+        list_due = sorted((q for q in self.queries if q.next_cycle <= self.cycle), key=lambda q: q.interval)
+        tasks = []
+        for index, twitter_query in enumerate(list_due):
+            session = self.pick_session(index)
+            if session is None:
+                break
+            tasks.append(self.get_tweets(twitter_query, session))
+        self.logger.info(Message(f"Twitter.scrape_user_tweets cycle {self.cycle} with list query: {', '.join(q.query for q in list_due[:len(tasks)])}"))
+        await asyncio.gather(*tasks)
 
@@ -1,4 +1,12 @@
 from telegram.ext import ContextTypes
+from contextlib import contextmanager
+import asyncio
+import hashlib
+import heapq
+import itertools
+import math
+import sys
+import time
 
 seconds_per_unit = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "M": 2592000, "y": 31536000} # assume 1 month = 30days, 1 year = 365 days
 
@@ -14,5 +22,136 @@ def remove_job_if_exists(name: str, context: ContextTypes.DEFAULT_TYPE) -> bool:
         job.schedule_removal()
     return True
 
-def is_command_trade(text: str | None) -> bool:
-    return text is not None and any(pattern in text.lower() for pattern in ["short", "long", "buy", "sell", "leverage", "sl"])
\ No newline at end of file
+class TokenBucket:
+    """Token bucket whose waiters are served by priority (lower first) then by arrival"""
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._serving: asyncio.Task | None = None
+
+    def _delay(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self, priority: int = 0):
+        if not self._waiters and self._delay() == 0.0:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._serving is None or self._serving.done():
+            self._serving = asyncio.create_task(self._serve())
+        await future
+
+    async def _serve(self):
+        while self._waiters:
+            delay = self._delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.cancelled():
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+
+    def try_acquire(self) -> bool:
+        """Take a token only if one is available right now"""
+        if not self._waiters and self._delay() == 0.0:
+            self.tokens -= 1
+            return True
+        return False
+
+    def pause(self, seconds: float):
+        """Hand out no token for the given time, used when Telegram answers RetryAfter"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class DigestCache:
+    """
+    key -> 64-bit digest of the last content seen, expiring ttl seconds after it was stored.
+    Keys are bucketed in a timing wheel of `resolution` seconds per slot, advancing the clock only expires
+    the slots it passes, so expiry is amortized O(1) and memory does not depend on the content length.
+    """
+    def __init__(self, ttl: float, resolution: float = 60):
+        self.ttl = ttl
+        self.resolution = resolution
+        self.slots: list[list[int]] = [[] for _ in range(math.ceil(ttl / resolution) + 1)]
+        self.entries: dict[int, int] = {} # key -> tick it was stored at << 64 | digest
+        self.tick = int(time.monotonic() // resolution)
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def digest(content: str) -> int:
+        return int.from_bytes(hashlib.blake2b(content.encode(), digest_size=8).digest(), "big")
+
+    def advance(self, now: float | None = None):
+        now = time.monotonic() if now is None else now
+        tick = int(now // self.resolution)
+        # a full turn expires everything, no need to walk more slots than the wheel has
+        for t in range(max(self.tick, tick - len(self.slots)) + 1, tick + 1):
+            slot = self.slots[t % len(self.slots)]
+            expired_tick = t - len(self.slots)
+            for key in slot:
+                value = self.entries.get(key)
+                # stale slot references of keys stored again later are skipped
+                if value is not None and value >> 64 <= expired_tick:
+                    del self.entries[key]
+                    self.evictions += 1
+            slot.clear()
+        self.tick = max(self.tick, tick)
+
+    def seen(self, key: int, content: str, now: float | None = None) -> bool:
+        """True when key already holds this content, otherwise store it and return False"""
+        self.advance(now)
+        digest = self.digest(content)
+        value = self.entries.get(key)
+        if value is not None and value & 0xFFFFFFFFFFFFFFFF == digest:
+            return True
+        self.entries[key] = self.tick << 64 | digest
+        self.slots[self.tick % len(self.slots)].append(key)
+        return False
+
+    def memory(self) -> int:
+        """Approximate bytes held by the cache"""
+        size = sys.getsizeof(self.entries) + sys.getsizeof(self.slots)
+        size += sum(sys.getsizeof(slot) for slot in self.slots)
+        # one int for the key and one for the value per entry
+        return size + len(self.entries) * (sys.getsizeof(1 << 40) + sys.getsizeof(1 << 90))
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "evictions": self.evictions, "memory": self.memory()}
+
+class Stopwatch:
+    """Latency spans of the stages of one operation, spans of concurrent stages overlap"""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: list[tuple[str, float]] = []
+
+    @contextmanager
+    def span(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((name, (time.perf_counter() - started) * 1000))
+
+    @property
+    def total(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def __str__(self):
+        return ", ".join(f"{name}={ms:.0f}ms" for name, ms in self.spans) + f", total={self.total:.0f}ms"
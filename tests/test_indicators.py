@@ -0,0 +1,35 @@
+import unittest
+import numpy as np
+from crypto_trading_news.indicators import parse_indicator, rsi
+
+class TestParseIndicator(unittest.TestCase):
+    def test_periods(self):
+        self.assertEqual(parse_indicator("ema20"), ("ema", 20))
+        self.assertEqual(parse_indicator("RSI"), ("rsi", 14))
+        self.assertEqual(parse_indicator("vwap"), ("vwap", None))
+        self.assertIsNone(parse_indicator("15m"))
+
+    def test_invalid_periods(self):
+        for token in ["ema0", "rsi1", "atr1", "bb1", "vwap50"]:
+            with self.assertRaises(Exception):
+                parse_indicator(token)
+        with self.assertRaises(Exception):
+            parse_indicator("sma6000", max_period=5000)
+        self.assertEqual(parse_indicator("sma5000", max_period=5000), ("sma", 5000))
+
+    def test_error_message_without_max_period(self):
+        with self.assertRaisesRegex(Exception, "at least 2"):
+            parse_indicator("rsi1")
+
+class TestRsi(unittest.TestCase):
+    def test_aligned_with_input(self):
+        for size in [0, 1, 2, 30]:
+            self.assertEqual(len(rsi(np.arange(size, dtype=np.float64), 14)), size)
+
+    def test_rising_prices(self):
+        result = rsi(np.arange(30, dtype=np.float64), 14)
+        self.assertTrue(np.isnan(result[:14]).all())
+        self.assertEqual(result[-1], 100.0)
+
+if __name__ == "__main__":
+    unittest.main()
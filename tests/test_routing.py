@@ -0,0 +1,34 @@
+import unittest
+from crypto_trading_news.routing import Router, RoutingRule
+
+class TestRouter(unittest.TestCase):
+    def router(self, *list_keywords: list[str]) -> Router:
+        return Router([RoutingRule([index + 1], ["*"], keywords) for index, keywords in enumerate(list_keywords)], [0])
+
+    def test_whole_words(self):
+        router = self.router(["sl"])
+        self.assertEqual(router.route("markets slowly recover", "telegram"), [0])
+        self.assertEqual(router.route("SL: 59000", "telegram"), [1])
+
+    def test_overlapping_keywords_same_start(self):
+        router = self.router(["stop"], ["stop loss"])
+        self.assertEqual(router.route("hit stop loss now", "telegram"), [1, 2])
+        self.assertEqual(sorted(router.iter_keywords("hit stop loss now")), ["stop", "stop loss"])
+        router = self.router(["long"], ["long term"])
+        self.assertEqual(router.route("long term hold", "telegram"), [1, 2])
+
+    def test_overlapping_keywords_inside_match(self):
+        router = self.router(["take profit"], ["profit"])
+        self.assertEqual(router.route("take profit at 61000", "telegram"), [1, 2])
+
+    def test_prefix_needs_word_boundary(self):
+        router = self.router(["long"], ["longer term"])
+        self.assertEqual(router.route("longer term view", "telegram"), [2])
+
+    def test_sources(self):
+        router = Router([RoutingRule([1], ["telegram:channel"], ["long"])], [0])
+        self.assertEqual(router.route("long btc", "telegram:123", "telegram:channel"), [1])
+        self.assertEqual(router.route("long btc", "discord:1"), [0])
+
+if __name__ == "__main__":
+    unittest.main()
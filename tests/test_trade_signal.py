@@ -0,0 +1,51 @@
+import unittest
+from crypto_trading_news.trade_signal import parse_signal, find_symbol
+
+SYMBOLS = {"BTCUSDT", "ETHUSDT", "SOLUSDT", "ONEUSDT"}
+
+def is_symbol(symbol: str) -> bool:
+    return symbol in SYMBOLS
+
+class TestParseSignal(unittest.TestCase):
+    def test_labelled_signal(self):
+        signal = parse_signal("#BTC LONG\nEntry: 60000 - 60500\nTP1: 61000\nTP2: 62000\nSL: 59000\nLeverage: 20x", is_symbol)
+        self.assertEqual(signal.symbol, "BTCUSDT")
+        self.assertEqual(signal.side, "BUY")
+        self.assertEqual(signal.entry, (60000, 60500))
+        self.assertEqual(signal.stop_loss, 59000)
+        self.assertEqual(signal.take_profits, [61000, 62000])
+        self.assertEqual(signal.leverage, 20)
+
+    def test_take_profit_numbering(self):
+        signal = parse_signal("BTC long\nEntry 60000\nStop 59000\nTake profit 1 61000", is_symbol)
+        self.assertEqual(signal.take_profits, [61000])
+        signal = parse_signal("$SOL short\nEntry: 150\nSL: 155\nTP: 1) 140 2) 130", is_symbol)
+        self.assertEqual(signal.take_profits, [140, 130])
+        signal = parse_signal("$SOL short\nEntry: 150\nSL: 155\nTargets: 140 (-6%) 130", is_symbol)
+        self.assertEqual(signal.take_profits, [140, 130])
+
+    def test_open_interest_is_not_an_entry(self):
+        signal = parse_signal("$ETH long\nOpen interest 5,000,000 and rising\nSL: 2900", is_symbol)
+        self.assertIsNone(signal.entry)
+        self.assertEqual(signal.stop_loss, 2900)
+        signal = parse_signal("$ETH long\nOpen: 3000\nSL: 2900", is_symbol)
+        self.assertEqual(signal.entry, (3000, 3000))
+
+    def test_wrong_side_levels_are_rejected(self):
+        self.assertIsNone(parse_signal("$BTC long\nEntry: 60000\nSL: 61000", is_symbol))
+        self.assertIsNone(parse_signal("$BTC long\nEntry: 60000\nSL: 59000\nTP: 58000", is_symbol))
+
+    def test_not_a_signal(self):
+        self.assertIsNone(parse_signal("Bitcoin slips below $60k as long-term holders take profit and miners sell", is_symbol))
+        self.assertIsNone(parse_signal("BTC long, no levels", is_symbol))
+
+class TestFindSymbol(unittest.TestCase):
+    def test_tagged_symbol_wins(self):
+        self.assertEqual(find_symbol("ONE more thing: buy $BTC", is_symbol), "BTCUSDT")
+
+    def test_ambiguous_untagged_symbols(self):
+        self.assertIsNone(find_symbol("ONE more thing: buy BTC", is_symbol))
+        self.assertEqual(find_symbol("buy BTC now", is_symbol), "BTCUSDT")
+
+if __name__ == "__main__":
+    unittest.main()